@@ -1,43 +1,153 @@
-from fastapi import APIRouter, UploadFile, File, WebSocket, Response
-from app.services.docx_parser import parse_docx
-from app.services.pdf_parser_fast import parse_pdf_fast
-from app.services.pdf_parser_neural import parse_pdf_neural
-from app.services.txt_parser import parse_txt
-from app.services.xml_builder import build_tree_structure, dict_to_xml
-import shutil
-import os
+from fastapi import APIRouter, Request, WebSocket, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.services.jobs import job_manager, QueueFull, RESULT_GONE
+from app.services.metrics import REGISTRY
+from app.services.spool import spool, UploadTooLarge, UnsupportedFormat
 
 router = APIRouter()
 
+# Готовый XML отдаётся клиенту кусками такого размера, а не одним телом ответа
+STREAM_CHUNK = 64 * 1024
+# Заголовки частей и прочие поля формы сверх размера самого файла
+UPLOAD_OVERHEAD = 64 * 1024
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    temp_filename = f"temp_{file.filename}"
-    with open(temp_filename, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename}
 
+def iter_chunks(text, size=STREAM_CHUNK):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class MultipartFile:
+    """
+    Поле-файл из тела multipart/form-data, разобранное по мере поступления тела запроса.
+    Starlette (UploadFile) сначала принимает и сохраняет всё тело целиком, а здесь каждый кусок
+    файла сразу уходит в spool.save, так что проверки формата и размера срабатывают на лету.
+    """
+
+    def __init__(self, stream, boundary, field="file"):
+        self.stream = stream
+        self.field = field
+        self.filename = ""
+        self._found = False
+        self._inside = False
+        self._name = self._value = b""
+        self._headers = {}
+        self._data = []
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._add_header(data[start:end], b""),
+            "on_header_value": lambda data, start, end: self._add_header(b"", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _add_header(self, name, value):
+        self._name += bytes(name)
+        self._value += bytes(value)
+
+    def _header_end(self):
+        self._headers[self._name.lower()] = self._value
+        self._name = self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._inside = not self._found and options.get(b"name") == self.field.encode()
+        if self._inside:
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+
+    def _part_data(self, data, start, end):
+        if self._inside: self._data.append(bytes(data[start:end]))
+
+    def _part_end(self):
+        if self._inside: self._found, self._inside = True, False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                self._parser.write(chunk)
+                if self._data:
+                    data, self._data = b"".join(self._data), []
+                    yield data
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Повреждённое тело multipart: {e}")
+        if self._data: yield b"".join(self._data)
+        if not self._found:
+            raise HTTPException(status_code=400, detail=f"В запросе нет поля {self.field}")
+
+
+def submit_job(file_id, mode):
+    try:
+        return job_manager.submit(file_id, mode)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-@router.post("/analyze/fast")
-async def analyze_fast(filename: str):
-    temp_filename = f"temp_{filename}"
-    ext = filename.split('.')[-1].lower()
 
+@router.post("/upload")
+async def upload_file(request: Request, filename: str = ""):
+    """
+    Файл - полем file формы multipart/form-data или самим телом запроса (имя - параметром filename).
+    Тело читается потоком; заведомо большой файл отвергается ещё по Content-Length.
+    """
     try:
-        if ext == 'docx':
-            flat_nodes = parse_docx(temp_filename)
-            toc_sequence = None
-        elif ext == 'txt':
-            flat_nodes, toc_sequence = parse_txt(temp_filename)
+        length = request.headers.get("content-length", "")
+        if length.isdigit(): spool.check_size(int(length) - UPLOAD_OVERHEAD)
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type == b"multipart/form-data":
+            if not options.get(b"boundary"):
+                raise HTTPException(status_code=400, detail="Нет boundary в Content-Type")
+            upload = MultipartFile(request.stream(), options[b"boundary"])
+            file_id = await spool.save(upload)
+            filename = upload.filename
         else:
-            flat_nodes, toc_sequence = parse_pdf_fast(temp_filename)
+            file_id = await spool.save(request.stream(), filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return {"filename": filename, "file_id": file_id}
 
-        tree_data = build_tree_structure(flat_nodes)
-        xml_content = dict_to_xml(tree_data, toc_items=toc_sequence)
-        return Response(content=xml_content, media_type="application/xml")
-    finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+
+@router.post("/jobs")
+async def create_job(file_id: str, mode: str = "fast"):
+    if mode not in ("fast", "neural", "hybrid"):
+        raise HTTPException(status_code=400, detail=f"Неизвестный режим: {mode}")
+    job = submit_job(file_id, mode)
+    return {"id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job.to_dict()
+
+
+@router.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.post("/analyze/fast")
+async def analyze_fast(file_id: str):
+    job = submit_job(file_id, "fast")
+    await job.wait()
+    if job.error:
+        raise HTTPException(status_code=500, detail=job.error)
+    xml_content = job.xml()
+    if xml_content is None:
+        raise HTTPException(status_code=410, detail=RESULT_GONE)
+    return StreamingResponse(iter_chunks(xml_content), media_type="application/xml")
 
 
 @router.websocket("/ws/analyze")
@@ -45,19 +155,27 @@ async def websocket_analyze(websocket: WebSocket):
     await websocket.accept()
     try:
         data = await websocket.receive_json()
-        filename = data.get("filename")
-        temp_filename = f"temp_{filename}"
+        mode = data.get("mode", "neural")
+        if mode not in ("neural", "hybrid"):
+            await websocket.send_json({"type": "error", "message": f"Неизвестный режим: {mode}"})
+            return
+        try:
+            job = job_manager.submit(data.get("file_id"), mode)
+        except (QueueFull, FileNotFoundError) as e:
+            await websocket.send_json({"type": "error", "message": str(e)})
+            return
 
-        async def send_status(pct, msg):
-            await websocket.send_json({"type": "progress", "percent": pct, "message": msg})
+        while not job.finished:
+            await job.wait_update()
+            if not job.finished:
+                await websocket.send_json({"type": "progress", "percent": job.progress, "message": job.message})
 
-        flat_nodes, toc_sequence = await parse_pdf_neural(temp_filename, progress_callback=send_status)
-        tree_data = build_tree_structure(flat_nodes)
-        xml_content = dict_to_xml(tree_data, toc_items=toc_sequence)
-        await websocket.send_json({"type": "complete", "xml": xml_content})
+        xml_content = None if job.error else job.xml()
+        if job.error or xml_content is None:
+            await websocket.send_json({"type": "error", "message": job.error or RESULT_GONE})
+        else:
+            await websocket.send_json({"type": "complete", "xml": xml_content})
     except Exception as e:
         await websocket.send_json({"type": "error", "message": str(e)})
     finally:
-        if 'temp_filename' in locals() and os.path.exists(temp_filename):
-            os.remove(temp_filename)
-        await websocket.close()
\ No newline at end of file
+        await websocket.close()
@@ -0,0 +1,142 @@
+"""
+Пакетный анализ каталогов с книгами (PDF, DOCX, TXT) в пуле процессов.
+
+    python -m app.batch books/ --output-dir xml/ --workers 8 --log batch.jsonl
+    python -m app.batch manuals/ --math latex
+
+XML пишется рядом с исходником (book.pdf -> book.pdf.xml) или в --output-dir с сохранением
+структуры каталогов. Файлы, у которых XML новее исходника, пропускаются (кроме --force).
+По каждому файлу в журнал JSONL пишется строка со временем этапов, числом страниц и разделов.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz
+
+from app.services.docx_parser import parse_docx
+from app.services.omml import MATH_FORMATS
+from app.services.pdf_parser_fast import parse_pdf_fast
+from app.services.txt_parser import parse_txt
+from app.services.xml_builder import iter_xml
+
+EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+def find_books(paths):
+    """Пары (файл, корень) - корень нужен, чтобы повторить структуру каталогов в --output-dir."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path, os.path.dirname(path)
+            continue
+        for dirpath, _, filenames in os.walk(path):
+            for name in sorted(filenames):
+                if name.lower().endswith(EXTENSIONS):
+                    yield os.path.join(dirpath, name), path
+
+
+def output_path(path, root, output_dir):
+    if output_dir is None:
+        return path + ".xml"
+    return os.path.join(output_dir, os.path.relpath(path, root) + ".xml")
+
+
+def is_up_to_date(path, out_path):
+    return os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path)
+
+
+def analyze_file(path, out_path, math="text") -> dict:
+    """Разбирает один файл и пишет XML; выполняется в процессе пула."""
+    ext = os.path.splitext(path)[1].lower()
+    record = {"path": path, "output": out_path, "format": ext[1:], "bytes": os.path.getsize(path)}
+    t_start = time.perf_counter()
+
+    if ext == '.docx':
+        sections = parse_docx(path, math)
+        toc_sequence = None
+        # Первый раздел - служебный ROOT, страница последнего - оценка числа страниц
+        pages = sections.pages[-1] if len(sections) else None
+        count = len(sections) - 1
+    elif ext == '.txt':
+        sections, toc_sequence = parse_txt(path)
+        pages = None
+        count = len(sections)
+    else:
+        sections, toc_sequence = parse_pdf_fast(path)
+        with fitz.open(path) as doc:
+            pages = doc.page_count
+        count = len(sections)
+    t_parse = time.perf_counter()
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = out_path + ".part"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in iter_xml(sections, toc_items=toc_sequence):
+                f.write(chunk)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        # Недописанный XML не должен оставаться рядом с результатами
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    t_xml = time.perf_counter()
+
+    record.update({
+        "status": "ok",
+        "pages": pages,
+        "sections": count,
+        "toc_items": len(toc_sequence) if toc_sequence else 0,
+        "parse_s": round(t_parse - t_start, 4),
+        "xml_s": round(t_xml - t_parse, 4),
+        "total_s": round(t_xml - t_start, 4),
+    })
+    return record
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m app.batch", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="файлы или каталоги с книгами")
+    ap.add_argument("--output-dir", help="куда писать XML (по умолчанию - рядом с исходниками)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число процессов")
+    ap.add_argument("--log", help="журнал JSONL (по умолчанию - stdout)")
+    ap.add_argument("--force", action="store_true", help="переразобрать даже актуальные файлы")
+    ap.add_argument("--math", choices=MATH_FORMATS, default="text", help="запись формул DOCX: текст или LaTeX")
+    args = ap.parse_args(argv)
+
+    log = open(args.log, "a", encoding="utf-8") if args.log else sys.stdout
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+
+    def write(record):
+        counts[record["status"]] += 1
+        log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        log.flush()
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {}
+            for path, root in find_books(args.paths):
+                out_path = output_path(path, root, args.output_dir)
+                if not args.force and is_up_to_date(path, out_path):
+                    write({"path": path, "output": out_path, "status": "skipped"})
+                    continue
+                futures[pool.submit(analyze_file, path, out_path, args.math)] = (path, out_path)
+
+            for future in as_completed(futures):
+                path, out_path = futures[future]
+                try:
+                    write(future.result())
+                except Exception as e:
+                    write({"path": path, "output": out_path, "status": "error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        if log is not sys.stdout: log.close()
+
+    print(f"Готово: {counts['ok']}, пропущено: {counts['skipped']}, ошибок: {counts['error']}", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
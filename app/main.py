@@ -1,8 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.api import router
+from app.services.jobs import job_manager
 
-app = FastAPI(title="Book Analyzer Service")
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    job_manager.shutdown()
+
+
+app = FastAPI(title="Book Analyzer Service", lifespan=lifespan)
 
 # Подключаем роуты
 app.include_router(router)
@@ -12,4 +21,4 @@ app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
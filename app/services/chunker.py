@@ -0,0 +1,92 @@
+"""
+Нарезка большого текста на куски для модели: по бюджету токенов и по границам абзацев и предложений.
+
+    split_chunks(text, 3000) -> ["кусок 1", "кусок 2", ...]
+
+Токены оцениваются без токенизатора - по классам символов. Кириллица в BPE-словарях дробится
+мельче латиницы, цифры идут по одной, пробелы обычно сливаются со следующим словом.
+Оценка намеренно завышена, чтобы кусок с ответом модели не переполнил окно контекста.
+
+Кусок набирается почти до бюджета, а режется там, где шов модели не заметен. Порядок выбора:
+абзац в последней четверти куска, иначе конец предложения во второй половине, иначе пробел между
+словами (не перенос «сло-\\nво»). Резать посреди слова приходится, только если пробелов нет совсем.
+"""
+import re
+
+_CYRILLIC = re.compile(r'[а-яёА-ЯЁ]+')
+_LATIN = re.compile(r'[a-zA-Z]+')
+_SPACE = re.compile(r'\s+')
+
+# Сотых долей токена на символ класса (остальное - цифры, знаки, прочие алфавиты - по токену на символ).
+# Целые веса: цены соседних срезов складываются без ошибок округления
+CYRILLIC_COST = 35
+LATIN_COST = 25
+SPACE_COST = 10
+OTHER_COST = 100
+
+_PARAGRAPH = re.compile(r'\n[ \t]*\n\s*')
+# Конец предложения: знак, закрывающие кавычки/скобки, пробелы и заглавная буква или открывающая кавычка
+_SENTENCE = re.compile(r'[.!?…][»"”\')\]]*\s+(?=[А-ЯЁA-Z«"„(—–])')
+# Пробел между словами, кроме переноса слова на новую строку
+_WORD = re.compile(r'(?<![-\s])\s+')
+
+
+def _cost(text):
+    """Оценка в сотых долях токена: сумма по символам, так что цены соседних срезов складываются."""
+    rest = _CYRILLIC.sub('', text)
+    cyrillic = len(text) - len(rest)
+    text = rest
+    rest = _LATIN.sub('', text)
+    latin = len(text) - len(rest)
+    text = rest
+    rest = _SPACE.sub('', text)
+    space = len(text) - len(rest)
+    return cyrillic * CYRILLIC_COST + latin * LATIN_COST + space * SPACE_COST + len(rest) * OTHER_COST
+
+
+def estimate_tokens(text: str) -> int:
+    return _cost(text) // 100
+
+
+def _limit(text, start, budget):
+    """
+    Самый дальний конец куска от start, укладывающийся в бюджет. Двоичный поиск; цена известной
+    части text[start:lo] копится, так что каждый шаг оценивает только text[lo:mid].
+    """
+    # Дешевле всего пробел (SPACE_COST), так что дальше этого кусок не дотянется
+    lo, hi = start, min(len(text), start + budget * 100 // SPACE_COST + 1)
+    cost, limit = 0, (budget + 1) * 100
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        more = _cost(text[lo:mid])
+        if cost + more < limit:  # то же, что estimate_tokens(text[start:mid]) <= budget
+            lo, cost = mid, cost + more
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _last_cut(pattern, text, lo, hi):
+    cut = None
+    for m in pattern.finditer(text, lo, hi):
+        cut = m.end()
+    return cut
+
+
+def split_chunks(text: str, budget: int) -> list:
+    """Куски текста не больше budget токенов (по оценке); склеенные подряд, они дают исходный текст."""
+    chunks, start = [], 0
+    while start < len(text):
+        end = _limit(text, start, budget)
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+        if end == start: end = start + 1  # один символ дороже бюджета
+        size = end - start
+        cut = (_last_cut(_PARAGRAPH, text, start + size * 3 // 4, end)
+               or _last_cut(_SENTENCE, text, start + size // 2, end)
+               or _last_cut(_WORD, text, start + 1, end)
+               or end)
+        chunks.append(text[start:cut])
+        start = cut
+    return chunks
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_key(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Дисковый кэш строк (SQLite) с вытеснением давно не использованных записей по размеру
+    и, если задан ttl (секунды), удалением устаревших.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=None, name="cache"):
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created)")
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            now = time.time()
+            row = self._conn.execute("SELECT value, size, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and row[2] + self.ttl < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes: return
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._size += size - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self):
+        if self.ttl is not None:
+            expired = time.time() - self.ttl
+            freed = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE created < ?", (expired,)
+            ).fetchone()[0]
+            if freed:
+                self._conn.execute("DELETE FROM entries WHERE created < ?", (expired,))
+                self._size -= freed
+        while self._size > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 64").fetchall()
+            if not rows: break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= size
+                if self._size <= self.max_bytes: break
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": self._size}
+
+    def close(self):
+        self._conn.close()
@@ -1,94 +1,31 @@
-import docx
-from docx.oxml.text.paragraph import CT_P
-from docx.oxml.table import CT_Tbl
+import posixpath
+import re
+import zipfile
+from docx.oxml.parser import element_class_lookup
 from docx.table import Table
-from docx.text.paragraph import Paragraph
 from lxml import etree
-from app.models import BookNode
+from app.services.sections import SectionTable
+from app.services.spool import BufferReader
+from app.services.metrics import stage
+from app.services.omml import omml_to_text
 
 # Пространства имен
 NAMESPACES = {
     'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
     'm': 'http://schemas.openxmlformats.org/officeDocument/2006/math'
 }
+W = '{%s}' % NAMESPACES['w']
+RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+STYLES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+# Уровней заголовков в Word девять (outlineLvl 0..8)
+MAX_LEVEL = 9
+_DIGITS = re.compile(r'\d+')
 
 
-def recurse_omml(element):
+def get_paragraph_text_with_math(para_element, math="text"):
     """
-    Рекурсивно обходит структуру формулы OMML и превращает теги в символы.
-    """
-    tag = element.tag
-    # Убираем пространство имен для удобства проверки (например {http...}f -> f)
-    local_tag = tag.split('}')[-1] if '}' in tag else tag
-
-    # 1. Текст внутри формулы (переменные, цифры)
-    if local_tag == 't':
-        return element.text if element.text else ""
-
-    # 2. Дробь (Fraction) -> (числитель / знаменатель)
-    if local_tag == 'f':
-        num_node = element.find('.//m:num', NAMESPACES)
-        den_node = element.find('.//m:den', NAMESPACES)
-        num_text = recurse_omml(num_node) if num_node is not None else ""
-        den_text = recurse_omml(den_node) if den_node is not None else ""
-        return f"({num_text}/{den_text})"
-
-    # 3. Корень (Radical) -> √(база)
-    if local_tag == 'rad':
-        # m:deg - это степень корня (например, 3 для кубического), она опциональна
-        deg_node = element.find('.//m:deg', NAMESPACES)
-        base_node = element.find('.//m:e', NAMESPACES)
-
-        base_text = recurse_omml(base_node) if base_node is not None else ""
-
-        # Если есть степень корня (например кубический)
-        deg_text = ""
-        if deg_node is not None:
-            # Проверяем, есть ли текст внутри узла степени (иногда он пуст)
-            raw_deg = "".join([recurse_omml(c) for c in deg_node])
-            if raw_deg:
-                deg_text = f"^{raw_deg}"
-
-        return f"√{deg_text}({base_text})"
-
-    # 4. Верхний индекс / Степень (Superscript) -> база^степень
-    if local_tag == 'sSup':
-        base_node = element.find('.//m:e', NAMESPACES)
-        sup_node = element.find('.//m:sup', NAMESPACES)
-        base_text = recurse_omml(base_node) if base_node is not None else ""
-        sup_text = recurse_omml(sup_node) if sup_node is not None else ""
-        return f"{base_text}^({sup_text})"
-
-    # 5. Нижний индекс (Subscript) -> база_индекс
-    if local_tag == 'sSub':
-        base_node = element.find('.//m:e', NAMESPACES)
-        sub_node = element.find('.//m:sub', NAMESPACES)
-        base_text = recurse_omml(base_node) if base_node is not None else ""
-        sub_text = recurse_omml(sub_node) if sub_node is not None else ""
-        return f"{base_text}_({sub_text})"
-
-    # 6. Индекс сверху и снизу (SubSup) -> база_индекс^степень
-    if local_tag == 'sSubSup':
-        base_node = element.find('.//m:e', NAMESPACES)
-        sub_node = element.find('.//m:sub', NAMESPACES)
-        sup_node = element.find('.//m:sup', NAMESPACES)
-        base_text = recurse_omml(base_node) if base_node is not None else ""
-        sub_text = recurse_omml(sub_node) if sub_node is not None else ""
-        sup_text = recurse_omml(sup_node) if sup_node is not None else ""
-        return f"{base_text}_({sub_text})^({sup_text})"
-
-    # Если тег не специальный (например, просто контейнер m:oMath, m:r),
-    # просто собираем текст со всех его детей
-    result = ""
-    for child in element:
-        result += recurse_omml(child)
-
-    return result
-
-
-def get_paragraph_text_with_math(para_element):
-    """
-    Извлекает текст из параграфа, преобразуя формулы в читаемый вид.
+    Извлекает текст из параграфа, преобразуя формулы в читаемый вид (math="latex" - в LaTeX).
     """
     text = ""
     for child in para_element:
@@ -100,8 +37,8 @@ def get_paragraph_text_with_math(para_element):
 
         # 2. Формулы (oMath или oMathPara)
         elif child.tag.endswith('oMath') or child.tag.endswith('oMathPara'):
-            # Запускаем рекурсивный парсер для формулы
-            formula_str = recurse_omml(child)
+            # Формула разбирается за один обход дерева
+            formula_str = omml_to_text(child, math)
             if formula_str:
                 # Добавляем пробелы, чтобы формула не слиплась с текстом
                 text += f" {formula_str} "
@@ -109,69 +46,181 @@ def get_paragraph_text_with_math(para_element):
     return text.strip()
 
 
-def check_page_breaks(element, current_page):
+def _rel_target(zf, rels_path, rel_type, base):
+    """Путь части пакета по типу связи из .rels (None, если связи нет)."""
+    try:
+        rels = etree.fromstring(zf.read(rels_path))
+    except KeyError:
+        return None
+    for rel in rels.iter(RELS):
+        if rel.get('Type') == rel_type and rel.get('TargetMode') != 'External':
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base, target))
+    return None
+
+
+def _outline_level(value):
+    """w:outlineLvl 0..8 - уровни 1..9; 9 (основной текст) и мусор - не заголовок."""
+    try:
+        level = int(value)
+    except (TypeError, ValueError):
+        return None
+    return level + 1 if 0 <= level < MAX_LEVEL else None
+
+
+def _name_level(name):
+    """Уровень по имени стиля «Heading N»/«Заголовок N»: первое число, в пределах 1..9, как у outlineLvl."""
+    name = name.lower()
+    if 'heading' not in name and 'заголовок' not in name:
+        return None
+    # Цифры дальше в имени (даты, версии) к уровню не относятся: "Заголовок 1 (2024-05-01)" - уровень 1
+    m = _DIGITS.search(name)
+    return min(max(int(m.group()), 1), MAX_LEVEL) if m else 1
+
+
+def read_heading_levels(zf, styles_path):
+    """
+    Один раз на документ: уровень заголовка для каждого styleId (None - не заголовок) и уровень
+    стиля абзаца по умолчанию. Уровень берётся из w:outlineLvl стиля, иначе из имени вида
+    "heading N"/"заголовок N", иначе наследуется по цепочке w:basedOn.
+    Неизвестный id или стиль не абзацного типа, как и в python-docx, означают стиль по умолчанию.
     """
-    Проверяет XML элемента на наличие маркеров разрыва страницы.
+    if styles_path is None or styles_path not in zf.namelist():
+        return {}, None
+
+    # styleId -> (абзацный ли, имя, outlineLvl, basedOn); берётся первый стиль с этим id
+    styles, default_id = {}, None
+    for style in etree.fromstring(zf.read(styles_path)).iter(W + 'style'):
+        style_id = style.get(W + 'styleId')
+        if style_id is None or style_id in styles:
+            continue
+        is_paragraph = style.get(W + 'type', 'paragraph') == 'paragraph'
+        name = style.find(W + 'name')
+        outline = style.find('w:pPr/w:outlineLvl', NAMESPACES)
+        based_on = style.find(W + 'basedOn')
+        styles[style_id] = (
+            is_paragraph,
+            (name.get(W + 'val') or "") if name is not None else "",
+            outline.get(W + 'val') if outline is not None else None,
+            based_on.get(W + 'val') if based_on is not None else None,
+        )
+        if is_paragraph and style.get(W + 'default') in ('1', 'true', 'on'): default_id = style_id
+
+    resolved = {}
+
+    def resolve(style_id, chain=()):
+        if style_id in resolved: return resolved[style_id]
+        entry = styles.get(style_id)
+        # Циклы basedOn в битых документах обрываются
+        if entry is None or style_id in chain: return None
+        _, name, outline, based_on = entry
+        if outline is not None:
+            level = _outline_level(outline)
+        else:
+            level = _name_level(name)
+            if level is None: level = resolve(based_on, chain + (style_id,))
+        resolved[style_id] = level
+        return level
+
+    default = resolve(default_id)
+    levels = {style_id: resolve(style_id) if entry[0] else default for style_id, entry in styles.items()}
+    return levels, default
+
+
+def paragraph_level(p, levels, default):
+    """Уровень заголовка абзаца или None; w:outlineLvl прямо в абзаце сильнее стиля."""
+    ppr = p.find(W + 'pPr')
+    if ppr is None:
+        return default
+    outline = ppr.find(W + 'outlineLvl')
+    if outline is not None:
+        return _outline_level(outline.get(W + 'val'))
+    style = ppr.find(W + 'pStyle')
+    return levels.get(style.get(W + 'val'), default) if style is not None else default
+
+
+def table_text(tbl):
+    table_text = "\n[ТАБЛИЦА]\n"
+    try:
+        for row in Table(tbl, None).rows:
+            row_data = [cell.text.strip() for cell in row.cells]
+            table_text += " | ".join(row_data) + "\n"
+    except:
+        pass
+    return table_text
+
+
+def parse_docx(source, math="text") -> SectionTable:
+    with stage("docx", "parse") as s:
+        sections = _parse_docx(source, math)
+        s.pages = sections.pages[-1]
+        s.chars = sections.chars()
+    return sections
+
+
+def _parse_docx(source, math="text") -> SectionTable:
     """
-    xml_str = etree.tostring(element, encoding='unicode')
-    # <w:br w:type="page"/>
-    hard_breaks = xml_str.count('type="page"')
-    # <w:lastRenderedPageBreak/>
-    soft_breaks = xml_str.count('lastRenderedPageBreak')
-    return current_page + hard_breaks + soft_breaks
-
-
-def parse_docx(file_path) -> list[BookNode]:
-    doc = docx.Document(file_path)
-    nodes = []
-    nodes.append({"title": "ROOT", "content": "", "level": 0, "page": 1})
+    Потоковый разбор: word/document.xml читается из архива через iterparse, элементы тела
+    обрабатываются по закрытию тега и сразу освобождаются. Разрывы страниц считаются по тегам.
+    """
+    # source - путь к файлу или буфер (memoryview над mmap)
+    with zipfile.ZipFile(source if isinstance(source, str) else BufferReader(source)) as zf:
+        document_path = _rel_target(zf, '_rels/.rels', OFFICE_DOCUMENT, '') or 'word/document.xml'
+        base, name = posixpath.split(document_path)
+        styles_path = _rel_target(zf, posixpath.join(base, '_rels', name + '.rels'), STYLES, base)
+        levels, default = read_heading_levels(zf, styles_path)
+
+        with zf.open(document_path) as stream:
+            return _parse_body(stream, levels, default, math)
+
+
+def _parse_body(stream, levels, default, math) -> SectionTable:
+    sections = SectionTable()
+    sections.add("ROOT", 0, 1)
+    # Текст раздела копится списком: конкатенация строк в словаре квадратична на больших книгах
+    parts = [[]]
     current_page = 1
-
-    if doc.element.body is not None:
-        body_elements = doc.element.body
-    else:
-        return nodes
-
-    for element in body_elements:
-        current_page = check_page_breaks(element, current_page)
-
-        if isinstance(element, CT_P):
-            para = Paragraph(element, doc)
-            text = get_paragraph_text_with_math(element)
-
-            if not text:
-                continue
-
-            style_name = para.style.name.lower() if para.style else ""
-
-            if 'heading' in style_name or 'заголовок' in style_name:
-                try:
-                    level_str = ''.join(filter(str.isdigit, style_name))
-                    level = int(level_str) if level_str else 1
-                except:
-                    level = 1
-
-                nodes.append({
-                    "title": text,
-                    "content": "",
-                    "level": level,
-                    "page": current_page
-                })
-            else:
-                if nodes:
-                    nodes[-1]["content"] += text + "\n"
-
-        elif isinstance(element, CT_Tbl):
-            tbl = Table(element, doc)
-            table_text = "\n[ТАБЛИЦА]\n"
-            try:
-                for row in tbl.rows:
-                    row_data = [cell.text.strip() for cell in row.cells]
-                    table_text += " | ".join(row_data) + "\n"
-            except:
-                pass
-
-            if nodes:
-                nodes[-1]["content"] += table_text
-
-    return nodes
\ No newline at end of file
+    pending_breaks = 0
+
+    events = etree.iterparse(stream, events=('end',), remove_blank_text=True, resolve_entities=False,
+                             tag=(W + 'p', W + 'tbl', W + 'br', W + 'lastRenderedPageBreak'))
+    # Классы python-docx нужны таблицам: ячейки с объединением разбираются как раньше
+    events.set_element_class_lookup(element_class_lookup)
+    for _, element in events:
+        tag = element.tag
+        if tag == W + 'br':
+            if element.get(W + 'type') == 'page': pending_breaks += 1
+            continue
+        if tag == W + 'lastRenderedPageBreak':
+            pending_breaks += 1
+            continue
+
+        body = element.getparent()
+        if body is None or body.tag != W + 'body':
+            # Абзацы внутри таблиц разбираются вместе с таблицей
+            continue
+        # Разрывы внутри элемента учитываются до него самого, как при подсчёте по всему XML элемента
+        current_page += pending_breaks
+        pending_breaks = 0
+
+        if tag == W + 'p':
+            text = get_paragraph_text_with_math(element, math)
+            if text:
+                level = paragraph_level(element, levels, default)
+
+                if level is not None:
+                    sections.add(text, level, current_page)
+                    parts.append([])
+                else:
+                    parts[-1].append(text + "\n")
+        else:
+            parts[-1].append(table_text(element))
+
+        # Обработанное больше не нужно: освобождаем элемент и всё, что было перед ним в теле
+        element.clear()
+        while element.getprevious() is not None:
+            del body[0]
+
+    # Текста-источника у разделов DOCX нет - содержимое хранится готовыми строками
+    sections.fill("".join(chunks) for chunks in parts)
+    return sections
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .disk_cache import DiskCache, make_key
+from .docx_parser import parse_docx
+from .llm_engine import llm_client
+from .metrics import REGISTRY, JOB_SECONDS, cache_collector, observe, stage
+from .pdf_parser_fast import parse_pdf_fast
+from .pdf_parser_neural import extract_sections, clean_sections
+from .quality import QUALITY_THRESHOLD
+from .spool import spool, open_mapped
+from .txt_parser import parse_txt
+from .xml_builder import to_xml
+
+# Версия разбора в ключе кэша: поднимается с каждой правкой, меняющей получаемый XML (колонтитулы,
+# нормализация, уровни заголовков, переводы строк TXT...). От чего зависит ответ модели,
+# в ключ добавляет llm_client.fingerprint()
+PARSER_VERSION = 7
+
+# Процессов на извлечение текста одного PDF (get_page_texts). Они запускаются из процесса пула задач,
+# так что всего процессов - до workers * PDF_PAGE_WORKERS
+PDF_PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", "1"))
+
+# Готовый XML по хэшу содержимого файла и режиму анализа
+result_cache = DiskCache(".cache/results", max_bytes=1024 * 1024 * 1024, ttl=7 * 24 * 3600, name="results")
+REGISTRY.collectors.append(cache_collector(result_cache, llm_client.cache))
+
+
+RESULT_GONE = "Результат больше не хранится, поставьте задачу заново"
+
+
+class QueueFull(Exception):
+    pass
+
+
+def build_xml(fmt, sections, toc_sequence) -> str:
+    with stage(fmt, "xml") as s:
+        xml_content = to_xml(sections, toc_items=toc_sequence)
+        s.chars = len(xml_content)
+    return xml_content
+
+
+def run_fast(file_path, fmt) -> tuple:
+    """Быстрый разбор файла целиком; выполняется в процессе пула. Возвращает XML и метрики процесса."""
+    if fmt == 'pdf':
+        # PDF открывается по пути: процессы извлечения страниц открывают документ по doc.name
+        sections, toc_sequence = parse_pdf_fast(file_path, workers=PDF_PAGE_WORKERS)
+        return build_xml(fmt, sections, toc_sequence), REGISTRY.drain()
+
+    with open_mapped(file_path) as buffer:
+        if fmt == 'docx':
+            sections = parse_docx(buffer)
+            toc_sequence = None
+        else:
+            sections, toc_sequence = parse_txt(buffer)
+
+    return build_xml(fmt, sections, toc_sequence), REGISTRY.drain()
+
+
+def run_extract(file_path) -> tuple:
+    """Извлечение разделов для нейро- и гибридного режима; выполняется в процессе пула."""
+    sections, sequence = extract_sections(file_path, workers=PDF_PAGE_WORKERS)
+    return sections, sequence, REGISTRY.drain()
+
+
+class Job:
+    def __init__(self, file_id, mode):
+        self.id = uuid.uuid4().hex
+        self.file_id = file_id
+        self.mode = mode
+        self.status = "queued"
+        self.progress = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        # Ключ результата в result_cache: оттуда читается XML, вытесненный из памяти
+        self.key = None
+        self.created = time.time()
+        self._updated = asyncio.Event()
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def update(self, status=None, progress=None, message=None):
+        if status is not None: self.status = status
+        if progress is not None: self.progress = progress
+        if message is not None: self.message = message
+        self._updated.set()
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.update(status="error" if error else "done", progress=100)
+        self._done.set()
+
+    def xml(self):
+        """Готовый XML: из памяти, а если его вытеснили (JobManager.keep_bytes) - из result_cache."""
+        if self.result is not None or self.key is None: return self.result
+        return result_cache.get(self.key)
+
+    async def wait_update(self):
+        await self._updated.wait()
+        self._updated.clear()
+
+    async def wait(self):
+        await self._done.wait()
+
+    def to_dict(self):
+        data = {"id": self.id, "file_id": self.file_id, "mode": self.mode, "status": self.status,
+                "progress": self.progress, "message": self.message}
+        if self.status == "done":
+            data["xml"] = self.xml()
+            if data["xml"] is None: data["error"] = RESULT_GONE
+        if self.status == "error": data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Очередь задач анализа: разбор выполняется в пуле процессов, одновременно - не больше workers задач,
+    всего незавершённых - не больше max_queue (дальше submit бросает QueueFull). Из завершённых
+    хранятся последние keep_finished, а их XML держится в памяти в пределах keep_bytes
+    (у более старых читается из result_cache).
+    """
+
+    def __init__(self, workers=None, max_queue=32, keep_finished=1000, keep_bytes=256 * 1024 * 1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.keep_finished = keep_finished
+        self.keep_bytes = keep_bytes
+        self.jobs = OrderedDict()
+        self._pool = None
+        self._slots = None
+        # Ссылки на запущенные задачи: цикл событий держит их слабо, без ссылки задачу может собрать GC
+        self._tasks = set()
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._pool
+
+    def _drop_pool(self, pool):
+        """Сломанный пул (процесс упал) больше не принимает задач - следующая задача создаст новый."""
+        if pool is not None and self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def submit(self, file_id, mode="fast") -> Job:
+        """Ставит загруженный файл в очередь; задача держит ссылку на файл в хранилище до завершения."""
+        if self.pending() >= self.max_queue:
+            raise QueueFull(f"Очередь заполнена ({self.max_queue} задач)")
+        spool.claim(file_id)
+        self._ensure_pool()
+        job = Job(file_id, mode)
+        self.jobs[job.id] = job
+        self._prune()
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        drop = max(0, len(finished) - self.keep_finished)
+        for job in finished[:drop]:
+            del self.jobs[job.id]
+        # XML книги на полторы тысячи страниц - мегабайты; в памяти остаются только последние
+        size = 0
+        for job in reversed(finished[drop:]):
+            if job.result is None: continue
+            size += sys.getsizeof(job.result)
+            if size > self.keep_bytes: job.result = None
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        file_path = spool.path(job.file_id)
+        start = time.perf_counter()
+        pool = None
+        try:
+            # file_id = <sha256 содержимого>.<формат>
+            if job.mode == "neural":
+                key = make_key(job.file_id, "neural", PARSER_VERSION, *llm_client.fingerprint())
+            elif job.mode == "hybrid":
+                key = make_key(job.file_id, "hybrid", PARSER_VERSION, *llm_client.fingerprint(), QUALITY_THRESHOLD)
+            else:
+                key = make_key(job.file_id, "fast", PARSER_VERSION)
+            job.key = key
+            xml_content = result_cache.get(key)
+
+            if xml_content is None:
+                if job.mode in ("neural", "hybrid"):
+                    # Процесс пула нужен только на извлечение текста, чистка моделью идёт в цикле событий
+                    async with self._slots:
+                        job.update(status="running", progress=5, message="Поиск оглавления...")
+                        pool = self._ensure_pool()
+                        sections, sequence, worker_metrics = await loop.run_in_executor(pool, run_extract, file_path)
+                    REGISTRY.merge(worker_metrics)
+
+                    async def progress(pct, msg):
+                        job.update(progress=pct, message=msg)
+
+                    # Гибридный режим отправляет модели только разделы, грязные после алгоритмической чистки
+                    threshold = QUALITY_THRESHOLD if job.mode == "hybrid" else None
+                    sections = await clean_sections(sections, progress, threshold=threshold)
+                    xml_content = build_xml(job.mode, sections, sequence)
+                else:
+                    async with self._slots:
+                        job.update(status="running", progress=5, message="Разбор файла...")
+                        fmt = job.file_id.rsplit('.', 1)[-1]
+                        pool = self._ensure_pool()
+                        xml_content, worker_metrics = await loop.run_in_executor(pool, run_fast, file_path, fmt)
+                    REGISTRY.merge(worker_metrics)
+                result_cache.put(key, xml_content)
+
+            job.finish(result=xml_content)
+        except BrokenProcessPool as e:
+            # Процесс пула аварийно завершился (например, MuPDF на битом PDF)
+            self._drop_pool(pool)
+            job.finish(error=f"Процесс разбора аварийно завершился: {e}")
+        except Exception as e:
+            job.finish(error=str(e))
+        finally:
+            spool.release(job.file_id)
+            observe(JOB_SECONDS, time.perf_counter() - start, job.mode, job.status)
+            self._prune()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+job_manager = JobManager()
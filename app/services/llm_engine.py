@@ -1,17 +1,78 @@
 import json
+import os
+import re
+import time
 import asyncio
 from openai import AsyncOpenAI
+from .chunker import estimate_tokens, split_chunks
+from .disk_cache import DiskCache, make_key
+from .metrics import record_llm
+
+# Менять при любой правке текста промптов: старые ответы в кэше станут недействительны
+PROMPT_VERSION = 1
+
+# Разделитель фрагментов в пакетном запросе; модель должна вернуть его без изменений
+BATCH_MARK = "<<<ФРАГМЕНТ {}>>>"
+_BATCH_MARK = re.compile(r'^[ \t]*<<<ФРАГМЕНТ (\d+)>>>[ \t]*$', re.MULTILINE)
+
+# Бюджет токенов текста в одном запросе чистки (по префиксу имени модели). Ответ примерно равен
+# тексту, поэтому бюджет - меньше половины окна контекста (num_ctx сервера) за вычетом промпта
+CHUNK_TOKENS = {"qwen2.5": 3000}
+DEFAULT_CHUNK_TOKENS = 1500
+
+
+def model_chunk_tokens(model: str) -> int:
+    return next((tokens for prefix, tokens in CHUNK_TOKENS.items() if model.startswith(prefix)),
+                DEFAULT_CHUNK_TOKENS)
+
+
+def split_batch(content, count):
+    """
+    Ответ на пакетный запрос по фрагментам. None, если разметка нарушена: разделители
+    не 1..count по порядку, перед первым есть текст или какой-то фрагмент пуст.
+    """
+    marks = list(_BATCH_MARK.finditer(content))
+    if [int(m.group(1)) for m in marks] != list(range(1, count + 1)): return None
+    if content[:marks[0].start()].strip(): return None
+    ends = [m.start() for m in marks[1:]] + [len(content)]
+    parts = [content[m.end():end].strip() for m, end in zip(marks, ends)]
+    return parts if all(parts) else None
 
 
 class LLMEngine:
-    def __init__(self):
+    # Пакетная чистка: соседние короткие разделы уходят одним запросом (в бюджете токенов куска)
+    SMALL_SECTION = 1500  # раздел длиннее этого чистится отдельно
+    BATCH_SECTIONS = 20
+
+    def __init__(self, base_url='http://localhost:11434/v1', model="qwen2.5:7b", concurrency=4,
+                 cache_dir=".cache/llm", cache_max_bytes=512 * 1024 * 1024, chunk_tokens=None):
         # Асинхронный клиент для Ollama
         self.client = AsyncOpenAI(
-            base_url='http://localhost:11434/v1',
+            base_url=base_url,
             api_key='ollama',
         )
         # Рекомендуемые модели: qwen2.5:7b (легкая) или qwen2.5:14b (средняя)
-        self.model = "qwen2.5:7b"
+        self.model = model
+        # Большой текст чистится кусками не больше стольких токенов (None - по таблице CHUNK_TOKENS)
+        self.chunk_tokens = chunk_tokens or model_chunk_tokens(model)
+        # Общий лимит одновременных запросов к модели (и по разделам, и по кускам)
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        # Кэш ответов на диске (cache_dir=None - без кэша)
+        self.cache = DiskCache(cache_dir, cache_max_bytes, name="llm") if cache_dir else None
+
+    def _cache_get(self, key):
+        return self.cache.get(key) if self.cache else None
+
+    def _cache_put(self, key, value):
+        if self.cache: self.cache.put(key, value)
+
+    def fingerprint(self) -> tuple:
+        """От чего зависит текст, полученный от модели (промпты, нарезка, пакеты): входит в ключ готового XML."""
+        return self.model, PROMPT_VERSION, self.chunk_tokens, self.SMALL_SECTION, self.BATCH_SECTIONS
+
+    def _clean_key(self, text, is_start):
+        return make_key(self.model, "clean", PROMPT_VERSION, is_start, text)
 
     async def extract_toc_json(self, text_pages: str):
         prompt = f"""
@@ -30,16 +91,29 @@ class LLMEngine:
 {text_pages}
 ---
 """
+        key = make_key(self.model, "toc", PROMPT_VERSION, text_pages)
+        cached = self._cache_get(key)
+        if cached is not None:
+            record_llm("toc", "cache")
+            return json.loads(cached)
+
+        start = None
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
+            async with self._slots:
+                start = time.perf_counter()
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    response_format={"type": "json_object"}
+                )
             data = json.loads(response.choices[0].message.content)
-            return data.get("items", [])
+            items = data.get("items", [])
+            record_llm("toc", "ok", time.perf_counter() - start, len(text_pages))
+            self._cache_put(key, json.dumps(items, ensure_ascii=False))
+            return items
         except Exception as e:
+            record_llm("toc", "error", None if start is None else time.perf_counter() - start, len(text_pages))
             print(f"LLM ToC Error: {e}")
             return []
 
@@ -61,29 +135,122 @@ class LLMEngine:
     ТЕКСТ:
     {text}
     """
+            key = self._clean_key(text, is_start)
+            cached = self._cache_get(key)
+            if cached is not None:
+                record_llm("clean", "cache")
+                return cached
+
+            start = None
             try:
+                async with self._slots:
+                    # Время ожидания слота не учитывается - только сам запрос
+                    start = time.perf_counter()
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.0,  # Максимальная точность
+                    )
+                cleaned = response.choices[0].message.content.strip()
+                record_llm("clean", "ok", time.perf_counter() - start, len(text))
+                self._cache_put(key, cleaned)
+                return cleaned
+            except Exception as e:
+                record_llm("clean", "error", None if start is None else time.perf_counter() - start, len(text))
+                return text  # Возвращаем оригинал при ошибке
+
+    def plan_batches(self, texts) -> list:
+        """
+        Группы индексов текстов для чистки (тексты не длиннее 10 символов не чистятся и в план
+        не входят). Подряд идущие короткие тексты собираются в пакет до chunk_tokens токенов;
+        длинные и уже лежащие в кэше остаются по одному и закрывают текущий пакет.
+        """
+        groups, batch, size = [], [], 0
+        for i, text in enumerate(texts):
+            if len(text) <= 10: continue
+            single = len(text) > self.SMALL_SECTION or self._cache_get(self._clean_key(text, False)) is not None
+            tokens = 0 if single else estimate_tokens(text)
+            if batch and (single or size + tokens > self.chunk_tokens or len(batch) == self.BATCH_SECTIONS):
+                groups.append(batch)
+                batch, size = [], 0
+            if single:
+                groups.append([i])
+                continue
+            batch.append(i)
+            size += tokens
+        if batch: groups.append(batch)
+        return groups
+
+    def count_requests(self, texts, groups) -> int:
+        """Сколько запросов уйдёт к модели по плану (без учёта кэша и откатов)."""
+        return sum(1 if len(group) > 1 else len(split_chunks(texts[group[0]], self.chunk_tokens))
+                   for group in groups)
+
+    async def clean_batch(self, texts) -> list:
+        """
+        Несколько коротких фрагментов одним запросом: каждый идёт после своего разделителя,
+        ответ делится обратно по разделителям. Если разметка ответа нарушена или запрос не удался,
+        фрагменты чистятся по одному.
+        """
+        body = "\n".join(f"{BATCH_MARK.format(n)}\n{text}" for n, text in enumerate(texts, 1))
+        prompt = f"""
+    Твоя роль: Технический редактор.
+    Задача: Восстановить связный текст нескольких фрагментов грязного PDF-экстракта.
+
+    ИНСТРУКЦИИ:
+    1. Сохрани весь смысл и все предложения.
+    2. Удали номера страниц, колонтитулы (верхние/нижние заголовки страниц).
+    3. Склей слова, разорванные переносом (на- пример -> например).
+    4. Исправь пробелы.
+    5. Каждый фрагмент начинается строкой {BATCH_MARK.format("N")}. Сохрани все эти строки без изменений
+       и в том же порядке, текст фрагмента пиши сразу после его строки. Не переноси текст между фрагментами.
+    6. Верни только чистый текст с этими строками, без твоих комментариев.
+
+    ТЕКСТ:
+    {body}
+    """
+        chars = sum(len(text) for text in texts)
+        start = parts = None
+        try:
+            async with self._slots:
+                start = time.perf_counter()
                 response = await self.client.chat.completions.create(
                     model=self.model,
                     messages=[{"role": "user", "content": prompt}],
-                    temperature=0.0,  # Максимальная точность
+                    temperature=0.0,
                 )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                return text  # Возвращаем оригинал при ошибке
+            parts = split_batch(response.choices[0].message.content, len(texts))
+            record_llm("clean_batch", "ok" if parts else "malformed", time.perf_counter() - start, chars)
+        except Exception as e:
+            record_llm("clean_batch", "error", None if start is None else time.perf_counter() - start, chars)
+
+        if parts is None:
+            return list(await asyncio.gather(*[self.clean_text_fragment(text) for text in texts]))
+        # Ответ кладётся в кэш по ключу отдельного фрагмента: повторный разбор найдёт его при любой группировке
+        for text, part in zip(texts, parts):
+            self._cache_put(self._clean_key(text, False), part)
+        return parts
 
     async def process_large_text(self, full_text, is_start=True):
-        # Если текст большой - режем на части
-        chunk_size = 6000
-        if len(full_text) <= chunk_size:
+        # Если текст не влезает в бюджет токенов - режем по абзацам и предложениям (app/services/chunker.py)
+        chunks = split_chunks(full_text, self.chunk_tokens)
+        if len(chunks) <= 1:
             return await self.clean_text_fragment(full_text, is_start=is_start)
 
-        parts = []
-        for i in range(0, len(full_text), chunk_size):
-            chunk = full_text[i: i + chunk_size]
-            cleaned = await self.clean_text_fragment(chunk, is_start=(i == 0 and is_start))
-            parts.append(cleaned)
+        # Куски чистятся параллельно (в пределах self.concurrency), порядок сохраняет gather
+        parts = await asyncio.gather(*[
+            self.clean_text_fragment(chunk, is_start=(i == 0 and is_start)) for i, chunk in enumerate(chunks)
+        ])
 
         return "\n".join(parts)
 
 
-llm_client = LLMEngine()
\ No newline at end of file
+# Настройки развёртывания из окружения: сервер, модель, лимит одновременных запросов,
+# кэш ответов (LLM_CACHE_DIR= пустой - без кэша) и бюджет токенов куска (0 - по таблице CHUNK_TOKENS)
+llm_client = LLMEngine(
+    base_url=os.environ.get("LLM_BASE_URL", "http://localhost:11434/v1"),
+    model=os.environ.get("LLM_MODEL", "qwen2.5:7b"),
+    concurrency=int(os.environ.get("LLM_CONCURRENCY", "4")),
+    cache_dir=os.environ.get("LLM_CACHE_DIR", ".cache/llm") or None,
+    chunk_tokens=int(os.environ.get("LLM_CHUNK_TOKENS", "0")) or None,
+)
\ No newline at end of file
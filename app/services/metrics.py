@@ -0,0 +1,214 @@
+"""
+Лёгкие метрики в текстовом формате Prometheus (без внешних зависимостей).
+
+Этапы разбора замеряются через stage():
+
+    with stage("pdf", "find_real_indices") as s:
+        mapped = find_real_indices(...)
+        s.chars = len(full_text)
+
+Разбор идёт в процессах пула, поэтому воркер возвращает накопленное через REGISTRY.drain(),
+а сервер добавляет его к своему реестру через REGISTRY.merge().
+METRICS_ENABLED=0 в окружении отключает замеры.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PAGES_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+CHARS_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def _labels(names, values):
+    if not names: return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+    def state(self):
+        return dict(self.values)
+
+    def merge(self, state):
+        for labels, value in state.items():
+            self.values[labels] = self.values.get(labels, 0) + value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (последняя - +Inf), сумма, количество]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+    def state(self):
+        return {labels: [list(c), s, n] for labels, (c, s, n) in self.values.items()}
+
+    def merge(self, state):
+        for labels, (counts, total, count) in state.items():
+            entry = self.values.get(labels)
+            if entry is None:
+                self.values[labels] = [list(counts), total, count]
+                continue
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        # Функции, отдающие готовые строки (например, статистика кэшей)
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def drain(self) -> dict:
+        """Накопленные значения (для передачи из процесса пула); реестр обнуляется."""
+        with self._lock:
+            state = {name: m.state() for name, m in self.metrics.items() if m.values}
+            for m in self.metrics.values(): m.values = {}
+        return state
+
+    def merge(self, state):
+        with self._lock:
+            for name, values in (state or {}).items():
+                if name in self.metrics: self.metrics[name].merge(values)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for m in self.metrics.values():
+                lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} {m.kind}")
+                lines.extend(m.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("book_stage_seconds", "Длительность этапа разбора", ("format", "stage"))
+STAGE_PAGES = REGISTRY.histogram("book_stage_pages", "Страниц обработано этапом", ("format", "stage"), PAGES_BUCKETS)
+STAGE_CHARS = REGISTRY.histogram("book_stage_chars", "Символов обработано этапом", ("format", "stage"), CHARS_BUCKETS)
+LLM_SECONDS = REGISTRY.histogram("book_llm_request_seconds", "Длительность запроса к модели", ("kind",))
+LLM_REQUESTS = REGISTRY.counter("book_llm_requests_total", "Запросы к модели по исходу", ("kind", "result"))
+LLM_CHARS = REGISTRY.counter("book_llm_input_chars_total", "Символов отправлено модели", ("kind",))
+JOB_SECONDS = REGISTRY.histogram("book_job_seconds", "Длительность задачи анализа", ("mode", "status"))
+
+
+class _Stage:
+    __slots__ = ("fmt", "name", "pages", "chars", "_start")
+
+    def __init__(self, fmt, name):
+        self.fmt, self.name = fmt, name
+        self.pages = self.chars = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        with REGISTRY._lock:
+            STAGE_SECONDS.observe(elapsed, self.fmt, self.name)
+            if self.pages is not None: STAGE_PAGES.observe(self.pages, self.fmt, self.name)
+            if self.chars is not None: STAGE_CHARS.observe(self.chars, self.fmt, self.name)
+
+
+class _NoStage:
+    __slots__ = ("pages", "chars")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def stage(fmt, name):
+    """Таймер этапа; в s.pages и s.chars можно записать объём обработанного."""
+    return _Stage(fmt, name) if ENABLED else _NoStage()
+
+
+def observe(histogram, value, *labels):
+    if not ENABLED: return
+    with REGISTRY._lock:
+        histogram.observe(value, *labels)
+
+
+def record_llm(kind, result, seconds=None, chars=0):
+    """Учёт одного запроса к модели (kind - toc/clean/clean_batch, result - ok/error/cache/malformed)."""
+    if not ENABLED: return
+    with REGISTRY._lock:
+        LLM_REQUESTS.inc(kind, result)
+        if seconds is not None: LLM_SECONDS.observe(seconds, kind)
+        if chars: LLM_CHARS.inc(kind, amount=chars)
+
+
+def cache_collector(*caches):
+    """Статистика DiskCache в виде метрик (добавляется в REGISTRY.collectors)."""
+    families = (("book_cache_hits_total", "counter", "hits"), ("book_cache_misses_total", "counter", "misses"),
+                ("book_cache_entries", "gauge", "entries"), ("book_cache_bytes", "gauge", "bytes"))
+
+    def collect():
+        stats = [(cache.name, cache.stats()) for cache in caches if cache is not None]
+        lines = []
+        for metric, kind, field in families:
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{cache="{name}"}} {s[field]}' for name, s in stats)
+        return lines
+    return collect
@@ -0,0 +1,254 @@
+"""
+Преобразование формул OMML (Office Math) в строку за один обход дерева.
+
+    omml_to_text(element)           - текстовая запись: (a/b), √^3(x), x^(2), x_(i)
+    omml_to_text(element, "latex")  - LaTeX: \\frac{a}{b}, \\sqrt[3]{x}, x^{2}, x_{i}
+
+Каждый узел посещается один раз, части конструкции (m:num, m:e, m:sup...) берутся только среди
+прямых детей, а результат копится в одном списке - время линейно от размера формулы.
+Обход идёт по явному стеку, поэтому глубина вложенности не упирается в предел рекурсии.
+
+Обработчик конструкции возвращает последовательность шагов: строка выводится как есть,
+элемент обходится, функция вызывается со списком вывода (например, чтобы убрать пустую степень корня),
+None пропускается.
+"""
+from types import FunctionType
+
+from lxml import etree
+
+MATH_FORMATS = ("text", "latex")
+
+M = '{http://schemas.openxmlformats.org/officeDocument/2006/math}'
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def _parts(element):
+    """Прямые дети по тегу (первый с каждым тегом)."""
+    parts = {}
+    for child in element.iterchildren(etree.Element):
+        parts.setdefault(child.tag, child)
+    return parts
+
+
+def _children(element, name):
+    return list(element.iterchildren(M + name))
+
+
+def _prop(parts, props, name, default):
+    """Значение m:val свойства конструкции (например, m:dPr/m:begChr)."""
+    pr = parts.get(M + props)
+    if pr is None: return default
+    child = pr.find(M + name)
+    if child is None: return default
+    return child.get(M + 'val', default)
+
+
+def _optional(child, before, after=""):
+    """Шаги для необязательной части: если она ничего не вывела, обрамление тоже убирается."""
+    if child is None: return ()
+    mark = []
+
+    def open_(out):
+        mark.append(len(out))
+        out.append(before)
+
+    def close(out):
+        # Пустых строк в out не бывает, поэтому пустая часть - это неизменившаяся длина
+        if len(out) == mark[0] + 1:
+            out.pop()
+        elif after:
+            out.append(after)
+    return open_, child, close
+
+
+def _walk(element, out, handlers):
+    stack = [element]
+    # Пройденные элементы держатся до конца обхода: когда lxml освобождает обёртку узла без живой
+    # обёртки у родителя, он поднимается по предкам, и на глубоких формулах обход стал бы квадратичным
+    visited = []
+    pop, push, emit, keep = stack.pop, stack.extend, out.append, visited.append
+    while stack:
+        item = pop()
+        cls = item.__class__
+        if cls is str:
+            emit(item)
+        elif cls is FunctionType:
+            item(out)
+        elif item is not None:
+            keep(item)
+            tag = item.tag
+            handler = handlers.get(tag)
+            if handler is not None:
+                push(reversed(handler(item)))
+            elif not tag.endswith('Pr'):
+                # Свойства (m:fPr, m:rPr, w:rPr...) текста не содержат; прочие узлы - контейнеры
+                push(item.iterchildren(etree.Element, reversed=True))
+
+
+# --- Текстовая запись ---
+
+def _text_t(element):
+    return (element.text,) if element.text else ()
+
+
+def _text_fraction(element):
+    parts = _parts(element)
+    return "(", parts.get(M + 'num'), "/", parts.get(M + 'den'), ")"
+
+
+def _text_radical(element):
+    parts = _parts(element)
+    return ("√", *_optional(parts.get(M + 'deg'), "^"), "(", parts.get(M + 'e'), ")")
+
+
+def _text_script(*order):
+    def handler(element):
+        parts = _parts(element)
+        steps = [parts.get(M + 'e')]
+        for name, mark in order:
+            steps += [mark + "(", parts.get(M + name), ")"]
+        return steps
+    return handler
+
+
+TEXT = {
+    M + 't': _text_t,
+    W + 't': _text_t,
+    M + 'f': _text_fraction,
+    M + 'rad': _text_radical,
+    M + 'sSup': _text_script(('sup', "^")),
+    M + 'sSub': _text_script(('sub', "_")),
+    M + 'sSubSup': _text_script(('sub', "_"), ('sup', "^")),
+}
+
+
+# --- LaTeX ---
+
+LATEX_ESCAPES = {'\\': r'\backslash ', '{': r'\{', '}': r'\}', '#': r'\#', '$': r'\$', '%': r'\%',
+                 '&': r'\&', '_': r'\_'}
+NARY = {'∑': r'\sum', '∏': r'\prod', '∐': r'\coprod', '∫': r'\int', '∬': r'\iint', '∭': r'\iiint',
+        '∮': r'\oint', '⋃': r'\bigcup', '⋂': r'\bigcap', '⋁': r'\bigvee', '⋀': r'\bigwedge'}
+ACCENTS = {'\u0302': r'\hat', '\u0303': r'\tilde', '\u0307': r'\dot', '\u0308': r'\ddot', '\u20d7': r'\vec',
+           '\u0304': r'\bar', '\u0305': r'\overline', '\u0306': r'\breve', '\u030c': r'\check'}
+DELIMITERS = {'{': r'\{', '}': r'\}', '〈': r'\langle', '〉': r'\rangle', '⌊': r'\lfloor', '⌋': r'\rfloor',
+              '⌈': r'\lceil', '⌉': r'\rceil', '‖': r'\|', '': '.'}
+
+
+def _latex_t(element):
+    text = element.text
+    if not text: return ()
+    if any(c in LATEX_ESCAPES for c in text):
+        text = "".join(LATEX_ESCAPES.get(c, c) for c in text)
+    return (text,)
+
+
+def _latex_fraction(element):
+    parts = _parts(element)
+    return r"\frac{", parts.get(M + 'num'), "}{", parts.get(M + 'den'), "}"
+
+
+def _latex_radical(element):
+    parts = _parts(element)
+    return (r"\sqrt", *_optional(parts.get(M + 'deg'), "[", "]"), "{", parts.get(M + 'e'), "}")
+
+
+def _latex_script(*order, pre=False):
+    def handler(element):
+        parts = _parts(element)
+        base = ["{", parts.get(M + 'e'), "}"]
+        steps = ["{}"] if pre else base
+        for name, mark in order:
+            steps += [mark + "{", parts.get(M + name), "}"]
+        return steps + base if pre else steps
+    return handler
+
+
+def _latex_delimiter(element):
+    parts = _parts(element)
+    begin = _prop(parts, 'dPr', 'begChr', "(")
+    separator = _prop(parts, 'dPr', 'sepChr', "|")
+    end = _prop(parts, 'dPr', 'endChr', ")")
+    steps = [r"\left" + DELIMITERS.get(begin, begin) + " "]
+    for i, e in enumerate(_children(element, 'e')):
+        if i: steps.append(" " + DELIMITERS.get(separator, separator) + " ")
+        steps.append(e)
+    steps.append(r" \right" + DELIMITERS.get(end, end))
+    return steps
+
+
+def _latex_nary(element):
+    parts = _parts(element)
+    char = _prop(parts, 'naryPr', 'chr', "∫")
+    return (NARY.get(char, char), *_optional(parts.get(M + 'sub'), "_{", "}"),
+            *_optional(parts.get(M + 'sup'), "^{", "}"), "{", parts.get(M + 'e'), "}")
+
+
+def _latex_function(element):
+    parts = _parts(element)
+    return r"\operatorname{", parts.get(M + 'fName'), "}{", parts.get(M + 'e'), "}"
+
+
+def _latex_accent(element):
+    parts = _parts(element)
+    char = _prop(parts, 'accPr', 'chr', "\u0302")
+    return ACCENTS.get(char, r"\hat") + "{", parts.get(M + 'e'), "}"
+
+
+def _latex_bar(element):
+    parts = _parts(element)
+    command = r"\overline{" if _prop(parts, 'barPr', 'pos', "bot") == "top" else r"\underline{"
+    return command, parts.get(M + 'e'), "}"
+
+
+def _latex_limit(command):
+    def handler(element):
+        parts = _parts(element)
+        return command + "{", parts.get(M + 'lim'), "}{", parts.get(M + 'e'), "}"
+    return handler
+
+
+def _latex_rows(begin, end, row_tag=None):
+    """Матрица (m:m/m:mr/m:e) или система (m:eqArr/m:e): ячейки через &, строки через \\\\."""
+    def handler(element):
+        steps = [begin]
+        for i, row in enumerate(_children(element, row_tag or 'e')):
+            if i: steps.append(r" \\ ")
+            if row_tag is None:
+                steps.append(row)
+                continue
+            for j, cell in enumerate(_children(row, 'e')):
+                if j: steps.append(" & ")
+                steps.append(cell)
+        steps.append(end)
+        return steps
+    return handler
+
+
+LATEX = {
+    M + 't': _latex_t,
+    W + 't': _latex_t,
+    M + 'f': _latex_fraction,
+    M + 'rad': _latex_radical,
+    M + 'sSup': _latex_script(('sup', "^")),
+    M + 'sSub': _latex_script(('sub', "_")),
+    M + 'sSubSup': _latex_script(('sub', "_"), ('sup', "^")),
+    M + 'sPre': _latex_script(('sub', "_"), ('sup', "^"), pre=True),
+    M + 'd': _latex_delimiter,
+    M + 'nary': _latex_nary,
+    M + 'func': _latex_function,
+    M + 'acc': _latex_accent,
+    M + 'bar': _latex_bar,
+    M + 'limLow': _latex_limit(r"\underset"),
+    M + 'limUpp': _latex_limit(r"\overset"),
+    M + 'm': _latex_rows(r"\begin{matrix} ", r" \end{matrix}", row_tag='mr'),
+    M + 'eqArr': _latex_rows(r"\begin{array}{l} ", r" \end{array}"),
+}
+
+HANDLERS = {"text": TEXT, "latex": LATEX}
+
+
+def omml_to_text(element, math="text") -> str:
+    """Формула (m:oMath, m:oMathPara или любой узел внутри) в виде строки; math - "text" или "latex"."""
+    out = []
+    _walk(element, out, HANDLERS[math])
+    return "".join(out)
@@ -1,8 +1,9 @@
 import fitz
 import re
 from app.models import BookNode
-from app.services.toc_parser import HeuristicParser, toc_to_linear_sequence
 from app.services.llm_engine import llm_client
+from app.services.pdf_utils import (PageTexts, read_toc_sequence, get_outline_sequence, find_outline_indices,
+                                    get_page_offsets)
 
 
 # --- ОБЩИЕ ФУНКЦИИ ---
@@ -86,25 +87,27 @@ def parse_pdf(file_path, mode="neural") -> list[BookNode]:
     doc = fitz.open(file_path)
 
     # 1. Структура (Оглавление)
-    # Сначала пробуем алгоритмически (быстро)
-    toc_text = ""
-    for i in range(min(15, len(doc))): toc_text += doc[i].get_text() + "\n"
-
-    parser = HeuristicParser()
-    toc_tree = parser.parse_toc(toc_text)
-
-    # Если алгоритм не справился (пустое дерево), зовем LLM только для оглавления
-    if not toc_tree.children:
-        print("Алгоритм не нашел оглавление, пробуем LLM...")
-        toc_list = llm_client.extract_toc_json(toc_text)
-        # Тут нужно конвертировать JSON список обратно в структуру, если нужно,
-        # но для простоты sequence мы можем собрать и из списка LLM.
-        sequence = toc_list  # LLM возвращает список словарей
-        # Сортируем
-        sequence.sort(key=lambda x: x.get('page', 0))
-    else:
-        sequence = toc_to_linear_sequence(toc_tree)
-        sequence.sort(key=lambda x: x['page'])
+    # Закладки PDF - готовое оглавление с точными страницами
+    sequence = get_outline_sequence(doc)
+    from_outline = bool(sequence)
+
+    # Иначе пробуем алгоритмически (быстро); страницы извлекаются один раз на весь разбор
+    store = PageTexts(doc)
+    if not from_outline:
+        sequence, _, _ = read_toc_sequence(store)
+
+        # Если алгоритм не справился (пустое дерево), зовем LLM только для оглавления
+        if not sequence:
+            print("Алгоритм не нашел оглавление, пробуем LLM...")
+            toc_text = "".join(store.page(i) for i in range(min(15, len(doc))))
+            toc_list = llm_client.extract_toc_json(toc_text)
+            # Тут нужно конвертировать JSON список обратно в структуру, если нужно,
+            # но для простоты sequence мы можем собрать и из списка LLM.
+            sequence = toc_list  # LLM возвращает список словарей
+            # Сортируем
+            sequence.sort(key=lambda x: x.get('page', 0))
+        else:
+            sequence.sort(key=lambda x: x['page'])
 
     if not sequence:
         doc.close()
@@ -113,10 +116,14 @@ def parse_pdf(file_path, mode="neural") -> list[BookNode]:
     print(f"Найдено {len(sequence)} разделов. Режим: {mode}")
 
     # 2. Читаем весь текст
-    full_text = get_all_text(doc)
+    pages = store.all()
+    full_text = "".join(pages)
 
-    # 3. Находим границы разделов
-    mapped_items = find_real_indices(full_text, sequence)
+    # 3. Находим границы разделов (по закладкам - только на их страницах)
+    if from_outline:
+        mapped_items = find_outline_indices(full_text, sequence, get_page_offsets(pages))
+    else:
+        mapped_items = find_real_indices(full_text, sequence)
 
     final_nodes = []
 
@@ -1,39 +1,58 @@
-import fitz
-import re
-from .pdf_utils import get_all_text, find_real_indices, clean_footer_header, get_clean_title
-from .toc_parser import HeuristicParser, toc_to_linear_sequence
+from .normalize import SECTION_PIPELINE
+from .pdf_utils import (open_pdf, PageTexts, read_toc_sequence, get_page_offsets, find_real_indices,
+                        find_outline_indices, get_outline_sequence, HeaderFooter)
+from .metrics import stage
+from .sections import SectionTable
+
+
+def parse_pdf_fast(source, workers=1) -> tuple:
+    doc = open_pdf(source)
+
+    # Закладки PDF дают уровни и точные страницы - эвристики оглавления не нужны
+    with stage("pdf", "outline"):
+        sequence = get_outline_sequence(doc)
+    from_outline = bool(sequence)
+
+    # Колонтитулы определяются по выборке страниц и вырезаются сразу при извлечении
+    with stage("pdf", "headers") as s:
+        headers = HeaderFooter.learn(doc)
+    # Каждая страница извлекается один раз: страницы оглавления переиспользуются для всего текста
+    store = PageTexts(doc, headers)
+    if not from_outline:
+        with stage("pdf", "toc") as s:
+            sequence, s.pages, s.chars = read_toc_sequence(store)
+    # Заголовки глав в начале страницы стоят там же, где колонтитулы, - их не вырезаем
+    headers.keep_titles(sequence)
+
+    with stage("pdf", "extract") as s:
+        pages = store.all(workers=workers)
+        s.pages = len(pages)
+    full_text = "".join(pages)
+
+    if from_outline:
+        # Разделы режутся по страницам закладок, поиск заголовков по всей книге не нужен
+        with stage("pdf", "find_outline_indices") as s:
+            mapped = find_outline_indices(full_text, sequence, get_page_offsets(pages))
+            s.pages = len(pages)
+    else:
+        with stage("pdf", "find_real_indices") as s:
+            mapped = find_real_indices(full_text, sequence, get_page_offsets(pages))
+            s.pages, s.chars = len(pages), len(full_text)
+
+    with stage("pdf", "sections") as s:
+        sections = _build_sections(full_text, mapped)
+        s.chars = len(full_text)
 
+    doc.close()
+    return sections, sequence
 
-def parse_pdf_fast(file_path) -> tuple:
-    doc = fitz.open(file_path)
-
-    toc_raw = ""
-    for i in range(min(25, len(doc))): toc_raw += doc[i].get_text() + "\n"
-    parser = HeuristicParser()
-    toc_tree = parser.parse_toc(toc_raw)
-    sequence = toc_to_linear_sequence(toc_tree)
-
-    full_text = get_all_text(doc)
-    full_text = clean_footer_header(full_text)
-
-    mapped = find_real_indices(full_text, sequence)
-    final_nodes = []
 
-    for i in range(len(mapped)):
-        curr = mapped[i]
-        start = curr['end_idx']
+def _build_sections(full_text, mapped) -> SectionTable:
+    # Переносы, пустые строки и недопустимые в XML символы убираются за один проход по разделу
+    # при записи XML - до неё раздел остаётся срезом общего текста
+    sections = SectionTable(full_text, clean=SECTION_PIPELINE.one)
+    for i, curr in enumerate(mapped):
         end = mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text)
-
-        raw_content = full_text[start:end].strip()
-        clean_content = re.sub(r'(\w+)-\n\s*(\w+)', r'\1\2', raw_content)
-        clean_content = re.sub(r'\n{3,}', '\n\n', clean_content)
-
-        final_nodes.append({
-            "title": curr['item']['title'],
-            "content": clean_content,
-            "level": curr['item'].get('level', 1),
-            "page": curr['item'].get('page', 0)
-        })
-
-    doc.close()
-    return final_nodes, sequence
\ No newline at end of file
+        sections.add(curr['item']['title'], curr['item'].get('level', 1), curr['item'].get('page', 0),
+                     curr['end_idx'], end)
+    return sections
\ No newline at end of file
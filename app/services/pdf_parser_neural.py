@@ -1,46 +1,117 @@
-import fitz
-import re
-from .pdf_utils import get_all_text, find_real_indices, clean_footer_header
-from .toc_parser import HeuristicParser, toc_to_linear_sequence
+import asyncio
+from .pdf_utils import (open_pdf, PageTexts, read_toc_sequence, get_page_offsets, find_real_indices,
+                        find_outline_indices, get_outline_sequence, HeaderFooter)
 from .llm_engine import llm_client
+from .metrics import stage
+from .normalize import SECTION_PIPELINE
+from .quality import text_quality
+from .sections import SectionTable
 
 
-async def parse_pdf_neural(file_path, progress_callback=None) -> tuple:
-    doc = fitz.open(file_path)
+def extract_sections(source, workers=1) -> tuple:
+    """Синхронная часть нейро-режима: оглавление, текст и сырые куски разделов."""
+    doc = open_pdf(source)
 
-    if progress_callback: await progress_callback(5, "Поиск оглавления...")
-    toc_raw = ""
-    for i in range(min(20, len(doc))): toc_raw += doc[i].get_text() + "\n"
-    parser = HeuristicParser()
-    toc_tree = parser.parse_toc(toc_raw)
-    sequence = toc_to_linear_sequence(toc_tree)
+    # Закладки PDF дают уровни и точные страницы - эвристики оглавления не нужны
+    with stage("neural", "outline"):
+        sequence = get_outline_sequence(doc)
+    from_outline = bool(sequence)
 
-    full_text = get_all_text(doc)
-    full_text = clean_footer_header(full_text)
-    mapped = find_real_indices(full_text, sequence)
+    # Колонтитулы определяются по выборке страниц и вырезаются сразу при извлечении
+    with stage("neural", "headers") as s:
+        headers = HeaderFooter.learn(doc)
+    # Каждая страница извлекается один раз: страницы оглавления переиспользуются для всего текста
+    store = PageTexts(doc, headers)
+    if not from_outline:
+        with stage("neural", "toc") as s:
+            sequence, s.pages, s.chars = read_toc_sequence(store)
+    # Заголовки глав в начале страницы стоят там же, где колонтитулы, - их не вырезаем
+    headers.keep_titles(sequence)
 
-    final_nodes = []
-    total = len(mapped)
+    with stage("neural", "extract") as s:
+        pages = store.all(workers=workers)
+        s.pages = len(pages)
+    full_text = "".join(pages)
+    if from_outline:
+        # Разделы режутся по страницам закладок, поиск заголовков по всей книге не нужен
+        with stage("neural", "find_outline_indices") as s:
+            mapped = find_outline_indices(full_text, sequence, get_page_offsets(pages))
+            s.pages = len(pages)
+    else:
+        with stage("neural", "find_real_indices") as s:
+            mapped = find_real_indices(full_text, sequence, get_page_offsets(pages))
+            s.pages, s.chars = len(pages), len(full_text)
 
+    sections = SectionTable(full_text)
     for i, curr in enumerate(mapped):
-        if progress_callback:
-            pct = int(10 + (i / total) * 85)
-            await progress_callback(pct, f"Нейро-чистка: {curr['item']['title'][:30]}")
+        end = mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text)
+        sections.add(curr['item']['title'], curr['item'].get('level', 1), curr['item'].get('page', 0),
+                     curr['end_idx'], end)
+
+    doc.close()
+    return sections, sequence
+
 
-        start, end = curr['end_idx'], (mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text))
-        raw_chunk = full_text[start:end].strip()
+async def clean_sections(sections: SectionTable, progress_callback=None, threshold=None, engine=None) -> SectionTable:
+    """
+    Сырые срезы разделов заменяются ответами модели (в той же таблице). С threshold (гибридный режим)
+    разделы сначала чистятся алгоритмически, как в быстром режиме, и к модели уходят только те,
+    чья оценка text_quality ниже порога; остальные остаются после алгоритмической чистки.
+    engine - LLMEngine, по умолчанию общий llm_client.
+    """
+    engine = engine or llm_client
+    total = len(sections)
+    texts = [sections.content(i) for i in range(total)]
+    contents = [""] * total
+    skipped = 0
+    if threshold is not None:
+        with stage("neural", "quality") as s:
+            contents = [SECTION_PIPELINE.one(text) for text in texts]
+            dirty = [text_quality(text) < threshold for text in contents]
+            s.chars = sum(len(text) for text in contents)
+        skipped = dirty.count(False)
+        # Чистые разделы в план не попадают (пустой текст модель не получает), грязные идут уже без переносов
+        texts = [text if bad else "" for text, bad in zip(contents, dirty)]
+        if progress_callback:
+            await progress_callback(10, f"Оценка качества: к модели уходят {total - skipped} из {total} разделов, "
+                                         f"без модели: {skipped}")
+    # Короткие соседние разделы чистятся одним запросом; разделы до 10 символов не чистятся вовсе
+    groups = engine.plan_batches(texts)
+    pending = sum(len(group) for group in groups)
+    done = total - pending
+    # Для отчёта: запросов по плану и сколько их было бы при чистке каждого раздела отдельным запросом
+    requests = engine.count_requests(texts, groups)
+    sources = contents if threshold is not None else texts
+    unbatched = engine.count_requests(sources, [[i] for i, text in enumerate(sources) if len(text) > 10])
+    report = f", без модели: {skipped}" if threshold is not None else ""
 
-        if len(raw_chunk) > 10:
-            clean_content = await llm_client.process_large_text(raw_chunk, is_start=False)
+    async def clean_group(group):
+        nonlocal done
+        if len(group) == 1:
+            parts = [await engine.process_large_text(texts[group[0]], is_start=False)]
         else:
-            clean_content = ""
+            parts = await engine.clean_batch([texts[i] for i in group])
+        for i, part in zip(group, parts):
+            contents[i] = part
 
-        final_nodes.append({
-            "title": curr['item']['title'],
-            "content": clean_content,
-            "level": curr['item'].get('level', 1),
-            "page": curr['item'].get('page', 0)
-        })
+        done += len(group)
+        if progress_callback:
+            pct = int(10 + (done / total) * 85)
+            title = sections.titles[group[-1]]
+            await progress_callback(pct, f"Нейро-чистка: {done}/{total} ({title[:30]}), "
+                                         f"запросов: {requests} вместо {unbatched}{report}")
 
-    doc.close()
-    return final_nodes, sequence
\ No newline at end of file
+    # Группы обрабатываются одновременно, число запросов к модели ограничивает engine
+    with stage("neural", "llm_clean") as s:
+        await asyncio.gather(*[clean_group(group) for group in groups])
+        s.chars = sections.chars()
+
+    sections.fill(contents)
+    return sections
+
+
+async def parse_pdf_neural(source, progress_callback=None, workers=1, threshold=None) -> tuple:
+    if progress_callback: await progress_callback(5, "Поиск оглавления...")
+    sections, sequence = extract_sections(source, workers=workers)
+    sections = await clean_sections(sections, progress_callback, threshold=threshold)
+    return sections, sequence
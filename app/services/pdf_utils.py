@@ -1,13 +1,252 @@
+import os
 import re
 import fitz
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from .normalize import PAGE_PIPELINE
+from .title_matcher import TitleFinder, TitleMatcher, tokenize
+from .toc_parser import HeuristicParser, toc_to_linear_sequence
 
+# Меньше страниц на процесс не имеет смысла: открытие документа и запуск пула дороже извлечения
+MIN_PAGES_PER_WORKER = 50
+# Сколько страниц до и после ожидаемой просматривается при поиске заголовка
+PAGE_WINDOW = 1
+# Оглавление ищется среди первых TOC_START_PAGES страниц и читается не дальше TOC_MAX_PAGES
+TOC_START_PAGES = 25
+TOC_MAX_PAGES = 100
+# Дальше TOC_START_PAGES оглавление продолжается, только пока каждая страница даёт столько строгих
+# пунктов (отточие и номер страницы): нумерованные списки основного текста так не выглядят
+TOC_CONTINUE_ITEMS = 5
+# Колонтитулы: сколько страниц смотреть при обучении и сколько строк у края страницы проверять
+HEADER_SAMPLE_PAGES = 64
+HEADER_EDGE_LINES = 2
+# Колонтитул повторяется хотя бы на такой доле страниц выборки (и не меньше чем на трёх)
+HEADER_MIN_SHARE = 0.25
+# Допуск по положению однострочного блока колонтитула, пт
+HEADER_TOLERANCE = 2.0
+# Закладки из одной-двух записей ("Обложка") структуру книги не описывают
+MIN_OUTLINE_ITEMS = 3
 
-def get_all_text(doc):
-    full_text = ""
-    for page in doc:
-        text = page.get_text().replace('\x00', '').replace('\x0c', ' ')
-        full_text += text + "\n"
-    return full_text
+
+def open_pdf(source):
+    """Открывает PDF по пути или из буфера (bytes, memoryview над mmap) без копирования."""
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+_DIGITS = re.compile(r'\d+')
+
+
+def _text_blocks(page):
+    # Склейка текста блоков совпадает с page.get_text(), а режим blocks ещё и быстрее
+    return [b for b in page.get_text("blocks") if b[6] == 0]
+
+
+def _block_lines(block):
+    text = block[4]
+    return (text[:-1] if text.endswith('\n') else text).split('\n')
+
+
+def _edge_key(line):
+    # Номера страниц и глав меняются от страницы к странице
+    return _DIGITS.sub('#', " ".join(line.split()))
+
+
+def _edges(blocks):
+    """Верхний и нижний текстовые блоки страницы (могут совпадать)."""
+    return min(blocks, key=lambda b: b[1]), max(blocks, key=lambda b: b[3])
+
+
+def _title_key(text):
+    return " ".join(tokenize(text))
+
+
+class HeaderFooter:
+    """
+    Колонтитулы документа, выученные по выборке страниц. Смотрятся только крайние блоки страницы:
+    lines - повторяющиеся крайние строки верхнего и нижнего блока (цифры заменены на #),
+    bands - положение (y0, y1) однострочного крайнего блока, повторяющееся от страницы к странице;
+    так находятся и колонтитулы с названием текущей главы. Одного положения мало: в книге без
+    колонтитулов первая и последняя строки тела тоже стоят на месте, а заголовок главы в начале
+    страницы стоит там же, где колонтитул. Поэтому положение принимается, только если текст блока
+    в нём повторяется на нескольких страницах. titles - строки заголовков оглавления (keep_titles),
+    они не вырезаются никогда: "Глава 1", "Глава 2"... с точностью до цифр тоже повторяются.
+    """
+
+    def __init__(self, top_lines=frozenset(), bottom_lines=frozenset(), top_bands=(), bottom_bands=(),
+                 titles=frozenset()):
+        self.top_lines = top_lines
+        self.bottom_lines = bottom_lines
+        self.top_bands = top_bands
+        self.bottom_bands = bottom_bands
+        self.titles = titles
+
+    def __bool__(self):
+        return bool(self.top_lines or self.bottom_lines or self.top_bands or self.bottom_bands)
+
+    @classmethod
+    def learn(cls, doc, sample_pages=HEADER_SAMPLE_PAGES):
+        lines = ({}, {})
+        # По краю страницы: положение -> страниц, (положение, текст) -> страниц
+        bands, texts = ({}, {}), ({}, {})
+        pages = 0
+        for i in range(0, len(doc), max(1, len(doc) // sample_pages)):
+            blocks = _text_blocks(doc[i])
+            if not blocks: continue
+            pages += 1
+            top, bottom = _edges(blocks)
+            found = (
+                {_edge_key(l) for l in _block_lines(top)[:HEADER_EDGE_LINES]},
+                {_edge_key(l) for l in _block_lines(bottom)[-HEADER_EDGE_LINES:]},
+            )
+            for counter, keys in zip(lines, found):
+                for key in keys:
+                    if key: counter[key] = counter.get(key, 0) + 1
+            for edge, block in enumerate((top, bottom)):
+                if len(_block_lines(block)) != 1: continue
+                band = (round(block[1]), round(block[3]))
+                bands[edge][band] = bands[edge].get(band, 0) + 1
+                key = (band, _edge_key(block[4]))
+                texts[edge][key] = texts[edge].get(key, 0) + 1
+
+        # На нескольких страницах повторы случайны
+        if pages < 4: return cls()
+        need = max(3, HEADER_MIN_SHARE * pages)
+        top_lines, bottom_lines = (frozenset(key for key, n in counter.items() if n >= need) for counter in lines)
+        accepted = []
+        for edge in (0, 1):
+            repeated = {}
+            for (band, _), n in texts[edge].items():
+                if n > 1: repeated[band] = repeated.get(band, 0) + n
+            accepted.append(tuple(band for band, n in bands[edge].items() if n >= need and repeated.get(band, 0) >= need))
+        return cls(top_lines, bottom_lines, *accepted)
+
+    def keep_titles(self, sequence):
+        """Запоминает заголовки оглавления или закладок (полные и без нумерации), чтобы не вырезать их."""
+        keys = set()
+        for item in sequence:
+            keys.update((_title_key(item['title']), _title_key(get_clean_title(item['title']))))
+        keys.discard("")
+        self.titles = frozenset(keys)
+
+    def _is_title(self, line) -> bool:
+        return bool(self.titles) and _title_key(line) in self.titles
+
+    @staticmethod
+    def _in_band(block, bands):
+        return len(_block_lines(block)) == 1 and any(
+            abs(block[1] - y0) <= HEADER_TOLERANCE and abs(block[3] - y1) <= HEADER_TOLERANCE for y0, y1 in bands)
+
+    def clean(self, blocks) -> str:
+        """Текст страницы без колонтитулов."""
+        if not self or not blocks:
+            return "".join(b[4] for b in blocks)
+        top, bottom = _edges(blocks)
+        parts = []
+        for b in blocks:
+            if ((b is top and self._in_band(b, self.top_bands)) or (b is bottom and self._in_band(b, self.bottom_bands))) \
+                    and not self._is_title(b[4]):
+                continue
+            if b is top or b is bottom:
+                lines = _block_lines(b)
+                lo, hi = 0, len(lines)
+                if b is top:
+                    while lo < min(HEADER_EDGE_LINES, hi) and _edge_key(lines[lo]) in self.top_lines \
+                            and not self._is_title(lines[lo]):
+                        lo += 1
+                if b is bottom:
+                    while hi > lo and len(lines) - hi < HEADER_EDGE_LINES and _edge_key(lines[hi - 1]) in self.bottom_lines \
+                            and not self._is_title(lines[hi - 1]):
+                        hi -= 1
+                if (lo, hi) != (0, len(lines)):
+                    if lo < hi: parts.append("\n".join(lines[lo:hi]) + "\n")
+                    continue
+            parts.append(b[4])
+        return "".join(parts)
+
+
+def _page_text(page, headers=None):
+    blocks = _text_blocks(page)
+    text = headers.clean(blocks) if headers else "".join(b[4] for b in blocks)
+    return PAGE_PIPELINE.one(text) + "\n"
+
+
+def _extract_page_range(file_path, start, stop, headers=None):
+    # Выполняется в дочернем процессе: у каждого воркера свой дескриптор fitz
+    with fitz.open(file_path) as doc:
+        return [_page_text(doc[i], headers) for i in range(start, stop)]
+
+
+def get_page_texts(doc, workers=1, start=0, headers=None):
+    """
+    Текст каждой страницы, начиная со start (с завершающим переводом строки), в порядке страниц.
+    headers - HeaderFooter: колонтитулы вырезаются сразу при извлечении, страница за страницей.
+    """
+    page_count = len(doc)
+    workers = min(workers, (page_count - start) // MIN_PAGES_PER_WORKER)
+    if workers < 2 or not doc.name:
+        return [_page_text(doc[i], headers) for i in range(start, page_count)]
+
+    step = -(-(page_count - start) // workers)
+    ranges = [(i, min(i + step, page_count)) for i in range(start, page_count, step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(_extract_page_range, [doc.name] * len(ranges), *zip(*ranges), [headers] * len(ranges))
+        return [text for part in parts for text in part]
+
+
+class PageTexts:
+    """
+    Текст страниц документа: каждая страница извлекается один раз и дальше переиспользуется
+    (страницы оглавления не извлекаются повторно при сборе всего текста).
+    """
+
+    def __init__(self, doc, headers=None):
+        self.doc = doc
+        self.headers = headers
+        self.texts = []
+
+    def __len__(self):
+        return len(self.doc)
+
+    def page(self, i) -> str:
+        while len(self.texts) <= i:
+            self.texts.append(_page_text(self.doc[len(self.texts)], self.headers))
+        return self.texts[i]
+
+    def all(self, workers=1) -> list:
+        if len(self.texts) < len(self.doc):
+            self.texts += get_page_texts(self.doc, workers=workers, start=len(self.texts), headers=self.headers)
+        return self.texts
+
+
+def read_toc_sequence(store: PageTexts, start_pages=TOC_START_PAGES, max_pages=TOC_MAX_PAGES) -> tuple:
+    """
+    Оглавление по тексту первых страниц: страницы читаются по одной, пока HeuristicParser
+    не сообщит о конце оглавления. Длинное оглавление читается и после start_pages, пока каждая
+    страница добавляет не меньше TOC_CONTINUE_ITEMS строгих пунктов. Возвращает (sequence, прочитано страниц, символов).
+    """
+    scanner = HeuristicParser().scanner()
+    pages = chars = strict_before = 0
+    for i in range(min(len(store), max_pages)):
+        # За пределами первых start_pages читаем, только пока оглавление продолжается так же плотно
+        if i >= start_pages and (not scanner.started or scanner.strict - strict_before < TOC_CONTINUE_ITEMS): break
+        strict_before = scanner.strict
+        text = store.page(i)
+        scanner.feed(text)
+        pages, chars = i + 1, chars + len(text)
+        if scanner.ended: break
+    return toc_to_linear_sequence(scanner.finish()), pages, chars
+
+
+def get_all_text(doc, workers=1):
+    return "".join(get_page_texts(doc, workers=workers))
+
+
+def get_page_offsets(pages):
+    """Смещение начала каждой страницы в склеенном тексте: offsets[i] - начало страницы i + 1."""
+    return [0] + list(accumulate(len(p) for p in pages))[:-1]
 
 
 def get_clean_title(title: str) -> str:
@@ -32,45 +271,95 @@ def find_toc_boundary(full_text, sequence):
     return last_toc_pos if last_toc_pos > 0 else 3000
 
 
-def find_real_indices(full_text, sequence):
+def _page_window(page, page_shift, page_offsets, text_len):
+    """Диапазон текста вокруг страницы, на которой ожидается заголовок, или None."""
+    if page_offsets is None or page_shift is None or not isinstance(page, int):
+        return None
+    expected = page + page_shift - 1
+    if expected < 0 or expected >= len(page_offsets):
+        return None
+    lo = page_offsets[max(expected - PAGE_WINDOW, 0)]
+    hi_page = expected + PAGE_WINDOW + 1
+    hi = page_offsets[hi_page] if hi_page < len(page_offsets) else text_len
+    return lo, hi
+
+
+def find_real_indices(full_text, sequence, page_offsets=None):
     start_pos = find_toc_boundary(full_text, sequence)
     indices_map = []
     current_pos = start_pos
+    # Разница между номером страницы в оглавлении и реальной страницей документа
+    page_shift = None
 
-    for item in sequence:
+    # Для каждого пункта два варианта: полный заголовок (2n) и без нумерации (2n + 1)
+    items = [item for item in sequence if item['title'].strip()]
+    variants = []
+    for item in items:
         full_title = item['title'].strip()
-        if not full_title: continue
-        clean_title = get_clean_title(full_title)
+        variants += [full_title, get_clean_title(full_title)]
+    occurrences = TitleFinder(variants, full_text, start_pos)
 
-        search_variants = [full_title, clean_title]
-        found_match = None
-        for title_to_search in search_variants:
-            tokens = re.findall(r'[a-zA-Zа-яА-Я0-9§]+', title_to_search)
-            if not tokens: continue
-            pattern_str = r"[\s\W]*?".join([re.escape(t) for t in tokens])
-            pattern = re.compile(pattern_str, re.IGNORECASE | re.DOTALL)
+    for n, item in enumerate(items):
+        pids = (2 * n, 2 * n + 1)
+        found = None
 
-            match = pattern.search(full_text, current_pos)
-            if not match: match = pattern.search(full_text, start_pos)
+        # 1. Сначала ищем рядом с ожидаемой страницей
+        window = _page_window(item.get('page'), page_shift, page_offsets, len(full_text))
+        if window and window[1] > current_pos:
+            for pid in pids:
+                found = occurrences.find(pid, max(window[0], current_pos), window[1])
+                if found: break
 
-            if match:
-                found_match = match
-                break
+        # 2. Если не нашли - по всему тексту
+        if not found:
+            for pid in pids:
+                found = occurrences.find(pid, current_pos) or occurrences.find(pid, start_pos)
+                if found: break
 
-        if found_match:
-            indices_map.append({"item": item, "start_idx": found_match.start(), "end_idx": found_match.end()})
-            current_pos = found_match.end()
+        if found:
+            indices_map.append({"item": item, "start_idx": found[0], "end_idx": found[1]})
+            current_pos = found[1]
+            if page_offsets is not None and isinstance(item.get('page'), int):
+                page_shift = bisect_right(page_offsets, found[0]) - item['page']
 
     indices_map.sort(key=lambda x: x['start_idx'])
     return indices_map
 
 
-def clean_footer_header(full_text):
-    lines = full_text.split('\n')
-    if len(lines) < 60: return full_text
-    counts = {}
-    for l in lines:
-        s = l.strip()
-        if len(s) > 20: counts[s] = counts.get(s, 0) + 1
-    junk = {l for l, c in counts.items() if c > 4}
-    return "\n".join([l for l in lines if l.strip() not in junk])
\ No newline at end of file
+def get_outline_sequence(doc) -> list:
+    """
+    Оглавление из закладок PDF: уровни и точные номера страниц документа, без разбора текста.
+    Пустой список, если закладок нет или их слишком мало.
+    """
+    sequence = []
+    for level, title, page, *_ in doc.get_toc(simple=True):
+        title = " ".join(title.split())
+        if title and 1 <= page <= len(doc):
+            sequence.append({"title": title, "level": level, "page": page})
+    return sequence if len(sequence) >= MIN_OUTLINE_ITEMS else []
+
+
+def find_outline_indices(full_text, sequence, page_offsets):
+    """
+    Границы разделов по закладкам: заголовок ищется только на целевой странице;
+    если его там нет (например, срезан вместе с колонтитулами), раздел начинается с начала страницы.
+    """
+    indices_map = []
+    current_pos = 0
+    for item in sequence:
+        page = item['page'] - 1
+        page_start = page_offsets[page]
+        page_end = page_offsets[page + 1] if page + 1 < len(page_offsets) else len(full_text)
+        # Несколько закладок на одной странице - ищем после предыдущего заголовка
+        lo = current_pos if page_start <= current_pos <= page_end else page_start
+
+        title = item['title']
+        found = TitleMatcher([title, get_clean_title(title)]).scan(full_text[lo:page_end])
+        match = found.find(0, 0) or found.find(1, 0)
+        start, end = (lo + match[0], lo + match[1]) if match else (lo, lo)
+
+        indices_map.append({"item": item, "start_idx": start, "end_idx": end})
+        current_pos = end
+
+    indices_map.sort(key=lambda x: x['start_idx'])
+    return indices_map
@@ -0,0 +1,43 @@
+"""
+Оценка текста раздела после алгоритмической чистки для гибридного режима: к модели уходят только
+разделы с оценкой ниже QUALITY_THRESHOLD, остальные остаются как есть.
+
+    text_quality(text) -> 1.0 (чистый текст) .. 0.0 (мусор)
+
+Признаки грязного извлечения, каждый - доля от своего предела (один признак на пределе роняет
+оценку до нуля, несколько складываются):
+    разорванные переносы «на- пример», оставшиеся после склейки «-\\n»     - на слово
+    строки из одних цифр (номера страниц, сноски, обрывки таблиц)          - на строку
+    слова со смесью кириллицы и латиницы, символы замены и значки шрифтов  - на слово
+    короткие строки сверх обычной доли (колонки, таблицы, рваная вёрстка)  - на строку
+"""
+import re
+
+QUALITY_THRESHOLD = 0.5
+
+HYPHEN_LIMIT = 0.02
+DIGIT_LINE_LIMIT = 0.1
+GARBAGE_LIMIT = 0.02
+# Короткие строки: обычная доля (концы абзацев) и превышение, на котором оценка падает до нуля
+SHORT_LINE = 30
+SHORT_NORMAL = 0.35
+SHORT_LIMIT = 0.4
+SHORT_MIN_LINES = 8  # в совсем коротком разделе доля коротких строк ничего не говорит
+
+_BROKEN_HYPHEN = re.compile(r'\w-\s+[а-яёa-z]')
+_DIGIT_LINE = re.compile(r'^[ \t]*\d+[ \t]*$', re.MULTILINE)
+_GARBAGE = re.compile(r'[а-яёА-ЯЁ][a-zA-Z]|[a-zA-Z][а-яёА-ЯЁ]|[\ufffd\ue000-\uf8ff\u25a0\u25a1]')
+
+
+def text_quality(text: str) -> float:
+    words = len(text.split())
+    if not words: return 1.0
+    lines = [line for line in text.split('\n') if line.strip()]
+
+    dirt = len(_BROKEN_HYPHEN.findall(text)) / words / HYPHEN_LIMIT
+    dirt += len(_DIGIT_LINE.findall(text)) / len(lines) / DIGIT_LINE_LIMIT
+    dirt += len(_GARBAGE.findall(text)) / words / GARBAGE_LIMIT
+    if len(lines) >= SHORT_MIN_LINES:
+        short = sum(1 for line in lines if len(line.strip()) < SHORT_LINE) / len(lines)
+        dirt += max(0.0, short - SHORT_NORMAL) / SHORT_LIMIT
+    return max(0.0, 1.0 - dirt)
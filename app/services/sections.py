@@ -0,0 +1,56 @@
+"""
+Таблица разделов книги - общий результат всех парсеров и вход xml_builder.
+
+Вместо словаря на каждый раздел - параллельные массивы: заголовки, уровни, страницы и границы
+содержимого в общем тексте книги. Содержимое остаётся срезом text[start:end] до записи XML;
+clean (например, SECTION_PIPELINE.one) применяется к срезу только при выдаче. Если своего текста
+у разделов нет (DOCX, ответы модели), готовые строки лежат в contents.
+"""
+from array import array
+
+
+class SectionTable:
+    __slots__ = ("titles", "levels", "pages", "starts", "ends", "text", "clean", "contents")
+
+    def __init__(self, text: str = "", clean=None):
+        self.titles = []
+        self.levels = array('h')
+        self.pages = array('l')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.text = text
+        self.clean = clean
+        self.contents = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, title, level, page, start=0, end=0):
+        """Раздел с содержимым text[start:end]; края обрезаются сразу по индексам (как strip)."""
+        text = self.text
+        while start < end and text[start].isspace(): start += 1
+        while end > start and text[end - 1].isspace(): end -= 1
+        self.titles.append(title)
+        self.levels.append(level)
+        self.pages.append(page or 0)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def fill(self, contents):
+        """Готовые тексты разделов вместо срезов; общий текст больше не нужен."""
+        self.contents = list(contents)
+        self.text, self.clean = "", None
+
+    @property
+    def lazy(self) -> bool:
+        """Содержимое - необработанные срезы общего текста: их можно отдавать по кускам."""
+        return self.contents is None and self.clean is None
+
+    def content(self, i) -> str:
+        if self.contents is not None: return self.contents[i]
+        text = self.text[self.starts[i]:self.ends[i]]
+        return self.clean(text) if self.clean else text
+
+    def chars(self) -> int:
+        if self.contents is not None: return sum(len(c) for c in self.contents)
+        return sum(self.ends) - sum(self.starts)
@@ -0,0 +1,190 @@
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Сколько первых байт загрузки нужно detect_format
+FORMAT_HEAD_BYTES = 1024
+# file_id = <sha256 содержимого>.<формат>; пустое имя, "." или каталог не должны указывать на само хранилище
+FILE_ID = re.compile(r'[0-9a-f]{64}\.(pdf|docx|txt)')
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def detect_format(head: bytes):
+    """Формат по первым байтам файла: 'pdf', 'docx', 'txt' или None."""
+    if b'%PDF-' in head[:1024]: return 'pdf'
+    if head.startswith(b'PK\x03\x04'): return 'docx'
+    if head and b'\x00' not in head: return 'txt'
+    return None
+
+
+class BufferReader(io.RawIOBase):
+    """Файловый объект поверх буфера (mmap) без копирования - для zipfile/python-docx."""
+
+    def __init__(self, buffer):
+        self._buf = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._buf) + offset
+        return self._pos
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._buf) - self._pos))
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+@contextmanager
+def open_mapped(path):
+    """Отображает файл в память и отдаёт memoryview на всё его содержимое."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        yield view
+    finally:
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            # Буфер ещё держит незакрытый документ - освободит сборщик мусора
+            pass
+
+
+class Spool:
+    """
+    Хранилище загрузок, адресуемое по содержимому: файл называется <sha256>.<формат>.
+    Загрузка держит файл, пока его не заберёт задача (claim) или не истечёт hold_ttl;
+    задача отпускает файл через release. Файл удаляется, когда на него не осталось ссылок.
+    """
+
+    def __init__(self, directory=".cache/spool", max_bytes=500 * 1024 * 1024, hold_ttl=3600):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hold_ttl = hold_ttl
+        self._holds = {}
+        self._refs = {}
+
+    def path(self, file_id) -> str:
+        if not isinstance(file_id, str) or not FILE_ID.fullmatch(file_id):
+            raise FileNotFoundError(f"Неверный идентификатор файла: {file_id}")
+        return os.path.join(self.directory, file_id)
+
+    def check_size(self, size):
+        if size > self.max_bytes:
+            raise UploadTooLarge(f"Файл больше {self.max_bytes // (1024 * 1024)} МБ")
+
+    async def save(self, chunks, filename="") -> str:
+        """
+        Потоково пишет загрузку (асинхронный итератор кусков bytes) в хранилище и возвращает file_id.
+        Имя файла для сообщений - filename или атрибут chunks.filename (у multipart оно известно не сразу).
+        Формат проверяется по первым FORMAT_HEAD_BYTES, размер - по мере поступления: неподходящий
+        или слишком большой файл отвергается, не дожидаясь конца тела запроса.
+        """
+        self.sweep()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        digest = hashlib.sha256()
+        size = 0
+        fmt = None
+        head = b""
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    self.check_size(size)
+                    if fmt is None:
+                        head += chunk
+                        if len(head) < FORMAT_HEAD_BYTES: continue
+                        fmt = self._format(head, getattr(chunks, "filename", filename))
+                        chunk, head = head, b""
+                    digest.update(chunk)
+                    out.write(chunk)
+                if fmt is None:
+                    if not head: raise UnsupportedFormat("Пустой файл")
+                    fmt = self._format(head, getattr(chunks, "filename", filename))
+                    digest.update(head)
+                    out.write(head)
+
+            file_id = f"{digest.hexdigest()}.{fmt}"
+            if os.path.exists(self.path(file_id)):
+                os.remove(tmp_path)
+                os.utime(self.path(file_id))
+            else:
+                os.replace(tmp_path, self.path(file_id))
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+        self._holds.setdefault(file_id, []).append(time.time())
+        return file_id
+
+    @staticmethod
+    def _format(head, filename):
+        fmt = detect_format(head)
+        if fmt is None:
+            raise UnsupportedFormat(f"Неподдерживаемый формат файла: {filename}")
+        return fmt
+
+    def claim(self, file_id) -> str:
+        """Передаёт ссылку загрузки задаче; возвращает путь к файлу."""
+        path = self.path(file_id)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Файл не найден: {file_id}")
+        holds = self._holds.get(file_id)
+        if holds: holds.pop(0)
+        self._refs[file_id] = self._refs.get(file_id, 0) + 1
+        return path
+
+    def release(self, file_id):
+        self._refs[file_id] = self._refs.get(file_id, 1) - 1
+        self._collect(file_id)
+
+    def _collect(self, file_id):
+        if self._refs.get(file_id, 0) > 0 or self._holds.get(file_id): return
+        self._refs.pop(file_id, None)
+        self._holds.pop(file_id, None)
+        if os.path.isfile(self.path(file_id)):
+            os.remove(self.path(file_id))
+
+    def sweep(self):
+        """Отпускает загрузки, которые так и не забрала ни одна задача."""
+        expired = time.time() - self.hold_ttl
+        for file_id in list(self._holds):
+            self._holds[file_id] = [t for t in self._holds[file_id] if t >= expired]
+            self._collect(file_id)
+        # Файлы, оставшиеся от прошлых запусков
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name not in self._refs and name not in self._holds and os.path.getmtime(path) < expired:
+                os.remove(path)
+
+
+spool = Spool()
@@ -0,0 +1,192 @@
+import re
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate
+
+# Буквы и цифры - отдельные токены, чтобы "Глава1" и "Глава 1" совпадали
+_TOKEN = re.compile(r'([a-zа-я§]+|[0-9]+)')
+# Текст сканируется блоками по границам строк, чтобы не держать список токенов всей книги
+SCAN_BLOCK = 1 << 18
+
+
+def _lower(text: str) -> str:
+    # lower() может удлинить отдельные символы (İ -> i̇), тогда смещения разъедутся
+    low = text.lower()
+    if len(low) == len(text): return low
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(_lower(text))
+
+
+class Occurrences:
+    """Вхождения каждого заголовка: отсортированные смещения начала и конца в тексте."""
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    def find(self, pid, pos, endpos=None):
+        """Первое вхождение заголовка pid, начинающееся не раньше pos (и заканчивающееся до endpos)."""
+        starts = self.starts[pid]
+        i = bisect_left(starts, pos)
+        if i == len(starts): return None
+        end = self.ends[pid][i]
+        if endpos is not None and end > endpos: return None
+        return starts[i], end
+
+
+class TitleMatcher:
+    """
+    Автомат Ахо-Корасик над нормализованными токенами заголовков.
+    Текст книги токенизируется один раз, все заголовки ищутся за один проход.
+    """
+
+    def __init__(self, titles: list):
+        self.patterns = [tokenize(t) for t in titles]
+        self._vocab = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pid, pattern in enumerate(self.patterns):
+            if pattern: self._add(pid, pattern)
+        self._link()
+
+    def _add(self, pid, pattern):
+        state = 0
+        for token in pattern:
+            tid = self._vocab.setdefault(token, len(self._vocab))
+            nxt = self._goto[state].get(tid)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][tid] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(pid)
+
+    def _link(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for tid, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and tid not in goto[f]: f = fail[f]
+                fail[nxt] = goto[f].get(tid, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def scan(self, text: str, pos: int = 0) -> Occurrences:
+        """Находит все вхождения всех заголовков в text[pos:] за один проход."""
+        goto, fail, out, vocab = self._goto, self._fail, self._out, self._vocab
+        lengths = [len(p) for p in self.patterns]
+        starts = [[] for _ in self.patterns]
+        ends = [[] for _ in self.patterns]
+        # Начала последних токенов из словаря: совпадение длины L - это последние L таких токенов подряд
+        recent = deque(maxlen=max(lengths, default=0) or 1)
+        state = 0
+
+        block_start = pos
+        while block_start < len(text):
+            # Перевод строки не входит в токен, поэтому блок по нему токены не режет
+            block_end = text.find('\n', block_start + SCAN_BLOCK)
+            block_end = len(text) if block_end < 0 else block_end + 1
+            # parts = [разделитель, токен, разделитель, токен, ..., разделитель]
+            parts = _TOKEN.split(_lower(text[block_start:block_end]))
+            offsets = list(accumulate(map(len, parts), initial=block_start))
+            tokens = parts[1::2]
+            del parts
+
+            # Начало токена j - offsets[2j + 1], конец - offsets[2j + 2]
+            for j, tid in enumerate(map(vocab.get, tokens)):
+                if tid is None:
+                    state = 0
+                    continue
+                while state and tid not in goto[state]: state = fail[state]
+                state = goto[state].get(tid, 0)
+                recent.append(offsets[2 * j + 1])
+                for pid in out[state]:
+                    starts[pid].append(recent[-lengths[pid]])
+                    ends[pid].append(offsets[2 * j + 2])
+            block_start = block_end
+        return Occurrences(starts, ends)
+
+
+# Сколько текста от позиции просматривает регулярное выражение, прежде чем уступить автомату
+REGEX_SPAN = 1 << 20
+# Части выражения заголовка. Классы с диапазонами кириллицы не используются: их компиляция
+# (битовая карта на 64К символов) дороже самого поиска, поэтому буквы - это \w без цифр и "_".
+# Разделитель токенов - не-\w (кроме §), а также "_" и "ё", которые в токены TitleMatcher не входят
+_SEP = r'(?:[^\w§]|[_ёЁ])'
+# Символ токена-слова: буква (кроме ё) или §
+_LETTER = r'(?:(?![ёЁ])[^\W\d_]|§)'
+# Прочие буквы и цифры (другие алфавиты, буквы с диакритикой): для автомата они разделители,
+# для выражения - буквы. Если такой символ есть рядом, ответ выражения может разойтись с автоматом
+_EXOTIC = re.compile(r'[^\Wa-zA-Zа-яА-ЯёЁ_0-9]')
+
+
+def _is_digits(token):
+    return token[0] in '0123456789'
+
+
+def title_pattern(tokens):
+    """
+    Регулярное выражение, находящее только вхождения TitleMatcher: токены заголовка - целые токены
+    текста подряд (между буквенными - хотя бы один разделитель, буквы и цифры могут идти слитно).
+    Выражение начинается с самого токена, а граница перед ним проверяется после: так re ищет
+    кандидатов по первому символу, а не примеряет выражение к каждой позиции.
+    """
+    if not tokens: return None
+    first = tokens[0]
+    before = '[0-9]' if _is_digits(first) else _LETTER
+    parts = [re.escape(first), f'(?<!{before}(?s:.){{{len(first)}}})']
+    for prev, token in zip(tokens, tokens[1:]):
+        parts.append(_SEP + ('+' if _is_digits(prev) == _is_digits(token) else '*'))
+        parts.append(re.escape(token))
+    parts.append('(?![0-9])' if _is_digits(tokens[-1]) else f'(?!{_LETTER})')
+    return re.compile("".join(parts), re.IGNORECASE)
+
+
+class TitleFinder:
+    """
+    Вхождения заголовков для find_real_indices - те же, что у TitleMatcher.scan(text, pos).
+    Обычно каждый заголовок стоит сразу за предыдущим, и одно регулярное выражение с коротким
+    поиском дешевле прохода автомата по всей книге. Автомат строится (один раз) при первом
+    промахе выражения и дальше отвечает на все запросы.
+    """
+
+    def __init__(self, titles: list, text: str, pos: int = 0):
+        self.titles = titles
+        self.text = text
+        self.pos = pos
+        self._patterns = {}
+        self._occurrences = None
+
+    def _pattern(self, pid):
+        if pid not in self._patterns:
+            self._patterns[pid] = title_pattern(tokenize(self.titles[pid]))
+        return self._patterns[pid]
+
+    def occurrences(self) -> Occurrences:
+        if self._occurrences is None:
+            self._occurrences = TitleMatcher(self.titles).scan(self.text, self.pos)
+        return self._occurrences
+
+    def find(self, pid, pos, endpos=None):
+        """Как Occurrences.find: первое вхождение, начинающееся не раньше pos (и заканчивающееся до endpos)."""
+        if self._occurrences is not None:
+            return self._occurrences.find(pid, pos, endpos)
+        pattern = self._pattern(pid)
+        if pattern is None: return None
+        text = self.text
+        limit = len(text) if endpos is None else endpos
+        bound = min(limit, pos + REGEX_SPAN)
+        # Один символ за границей - чтобы проверка конца токена видела настоящий следующий символ
+        m = pattern.search(text, pos, min(len(text), bound + 1))
+        # Выражение строже автомата только рядом с "прочими" буквами - тогда ответ даёт автомат
+        if m and m.end() <= bound and not _EXOTIC.search(text, max(pos - 1, 0), min(len(text), m.end() + 1)):
+            return m.start(), m.end()
+        return self.occurrences().find(pid, pos, endpos)
@@ -1,7 +1,62 @@
 import re
 
+# Виды строк оглавления (в порядке приоритета)
+ITEM = r'(?P<title>.+?)(?:\.{2,}|(?:\.[\s\t]+){2,}|\…|\t+|\s{3,}|_{2,})(?:.*?)(?P<page>\d+)$'
+ITEM_START = r'(?P<start_page>\d+)\s+(?P<start_title>[А-ЯA-Z].+)$'
+LOOSE_ITEM = (r'(?P<loose_title>(?:Глава|Chapter|Часть|Раздел|§|[IVXLCDM]+\.|[0-9]+(?:\.[0-9]+)*\.?).+?)'
+              r'(?:\s+|\t+)(?P<loose_page>\d+)$')
+STRUCTURE = (r'\s*(Глава|Chapter|Часть|Part|Раздел|§|Введение|Предисловие|Заключение|Об авторе|Благодарности|'
+             r'Приложения|Примечания|Литература|Библиография|Указатель|'
+             r'[IVXLCDM]+\.|[0-9]+(?:\.[0-9]+)+\.?|[0-9]+\.)(?:\s*|(?=[А-ЯA-Z]))')
+
+# Строка классифицируется одним проходом: альтернативы пробуются по порядку, как прежние
+# item_pattern -> item_pattern_start -> loose_item_pattern -> structure_start
+LINE = re.compile(f'(?P<strict>{ITEM})|(?P<start>{ITEM_START})|(?i:(?P<loose>{LOOSE_ITEM}))|'
+                  f'(?i:(?P<structure>{STRUCTURE}))')
+PAGE_KINDS = ('strict', 'start', 'loose')
+
+_PAGE_NUMBER_PREFIX = re.compile(r'^\d+\s+(?=(Глава|Chapter|§|[0-9]+\.|[A-Za-zА-Яа-я]))')
+_NON_WORD = re.compile(r'[\W_]+')
+_NUMBERED_CHAPTER = re.compile(r'^\s*\d+\.\s+[А-ЯA-Z]')
+_GLUED_NUMBER = re.compile(r'^(\d+\.)([А-ЯA-Z])')
+# Отточие в хвосте заголовка: точки, подчёркивания, многоточия и пробелы
+LEADER_CHARS = '._…'
+_GLUED_SUBSECTIONS = re.compile(r'(?<=[а-яА-Яa-zA-Z])\s+(?=\d+\.\d+)')
+_DIGITS = re.compile(r'^\d+$')
+# Заголовок короче этого не считается признаком начала основного текста
+CONTENT_START_MIN = 10
+
+
+def _strip_leader(title):
+    # Линейный проход с конца: регулярное выражение с вложенным повтором на длинном отточии
+    # перебирало разбиения хвоста заново с каждой позиции
+    end = len(title)
+    while end and (title[end - 1] in LEADER_CHARS or title[end - 1].isspace()): end -= 1
+    return title[:end]
+
+
+class TitlePrefixes:
+    """
+    Нормализованные заголовки длиннее min_len, сгруппированные по первым min_len + 1 символам:
+    проверка «строка начинается с одного из них» - один поиск в словаре вместо перебора всех заголовков.
+    """
+
+    def __init__(self, min_len):
+        self.key_len = min_len + 1
+        self.buckets = {}
+
+    def add(self, title):
+        if len(title) < self.key_len: return
+        self.buckets.setdefault(title[:self.key_len], set()).add(title)
+
+    def has_prefix_of(self, text) -> bool:
+        bucket = self.buckets.get(text[:self.key_len])
+        return bucket is not None and any(text.startswith(title) for title in bucket)
+
 
 class TocNode:
+    __slots__ = ("title", "level", "page", "children")
+
     def __init__(self, title, level, page=None):
         self.title = title
         self.level = level
@@ -17,161 +72,37 @@ class HeuristicParser:
         self.header_markers = ['оглавление', 'содержание', 'contents', 'table of contents']
 
         # 1. ПАТТЕРН ПУНКТА С НОМЕРОМ СТРАНИЦЫ
-        self.item_pattern = re.compile(
-            r'^(.+?)(?:\.{2,}|(?:\.[\s\t]+){2,}|\…|\t+|\s{3,}|_{2,})(.*?)(\d+)$'
-        )
+        self.item_pattern = re.compile('^' + ITEM)
 
         # 2. НОВЫЙ ПАТТЕРН: Номер Название (6 Об авторе)
-        self.item_pattern_start = re.compile(r'^(\d+)\s+([А-ЯA-Z].+)$')
+        self.item_pattern_start = re.compile('^' + ITEM_START)
 
         # 3. СЛАБЫЙ ПАТТЕРН
-        self.loose_item_pattern = re.compile(
-            r'^((?:Глава|Chapter|Часть|Раздел|§|[IVXLCDM]+\.|[0-9]+(?:\.[0-9]+)*\.?).+?)(\s+|\t+)(\d+)$',
-            re.IGNORECASE
-        )
+        self.loose_item_pattern = re.compile('^' + LOOSE_ITEM, re.IGNORECASE)
 
         # 4. НАЧАЛО СТРУКТУРЫ
-        self.structure_start = re.compile(
-            r'^\s*(Глава|Chapter|Часть|Part|Раздел|§|Введение|Предисловие|Заключение|Об авторе|Благодарности|' +
-            r'Приложения|Примечания|Литература|Библиография|Указатель|' +
-            r'[IVXLCDM]+\.|[0-9]+(?:\.[0-9]+)+\.?|[0-9]+\.)(?:\s*|(?=[А-ЯA-Z]))',
-            re.IGNORECASE
-        )
+        self.structure_start = re.compile('^' + STRUCTURE, re.IGNORECASE)
 
     def parse_toc(self, text: str) -> TocNode:
-        lines = text.split('\n')
-        root = TocNode("Root", 0)
-
-        current_chapter = None
-        pending_title = ""
-        pending_level = 0
-
-        seen_titles = set()
-        toc_started = False
-        misses = 0
-        MAX_MISSES = 50
-
-        clean_lines = self._preprocess_lines(lines)
-
-        for line in clean_lines:
-            line_raw = line.strip()
-            if not line_raw: continue
-
-            norm_line = self._normalize(line_raw)
-
-            # --- 1. ПОИСК СТАРТА ---
-            if not toc_started:
-                if 'краткое' in norm_line: continue
-                if len(line_raw) < 50 and (
-                        any(m in norm_line for m in self.header_markers) or line_raw.upper() == "ВВЕДЕНИЕ"):
-                    toc_started = True
-                    if line_raw.upper() == "ВВЕДЕНИЕ":
-                        self._add_node(root, current_chapter, line_raw, 1, None)
-                        seen_titles.add(self._normalize(line_raw))
-                    continue
-                if self.item_pattern.match(line_raw) or self.item_pattern_start.match(
-                        line_raw) or self.structure_start.match(line_raw):
-                    toc_started = True
-                else:
-                    continue
-
-            # --- 2. ПРОВЕРКА НА ВЫХОД (Конец оглавления) ---
-            match_strict = self.item_pattern.match(line_raw)
-            match_start = self.item_pattern_start.match(line_raw)
-            match_loose = self.loose_item_pattern.match(line_raw)
-            has_page = bool(match_strict or match_start or match_loose)
-
-            if not has_page and self._is_content_start(norm_line, seen_titles):
-                break
-
-            if len(line_raw) < 50 and any(m in norm_line for m in self.header_markers):
-                continue
-
-            if len(line_raw) > 300:
-                pending_title = ""
-                misses += 1
-                if misses > MAX_MISSES: break
-                continue
-
-            # --- СЦЕНАРИЙ А: ЕСТЬ СТРАНИЦА ---
-            if has_page:
-                if match_strict:
-                    title_part, page_part = match_strict.group(1).strip(), match_strict.group(3)
-                elif match_start:
-                    page_part, title_part = match_start.group(1), match_start.group(2).strip()
-                else:
-                    title_part, page_part = match_loose.group(1).strip(), match_loose.group(3)
-
-                if pending_title:
-                    if not self.structure_start.match(title_part):
-                        full_title = pending_title + " " + title_part
-                        self._add_node(root, current_chapter, full_title, pending_level, page_part)
-                        if pending_level == 1 and root.children: current_chapter = root.children[-1]
-                        seen_titles.add(self._normalize(full_title))
-                        pending_title = ""
-                        misses = 0
-                        continue
-                    else:
-                        prev = self._add_node(root, current_chapter, pending_title, pending_level, None)
-                        if pending_level == 1: current_chapter = prev
-                        seen_titles.add(self._normalize(pending_title))
-                        pending_title = ""
-
-                level = self._guess_level(title_part)
-                if not current_chapter: level = 1
-                new_node = self._add_node(root, current_chapter, title_part, level, page_part)
-                if level == 1: current_chapter = new_node
-                seen_titles.add(self._normalize(title_part))
-                misses = 0
-                continue
-
-            # --- СЦЕНАРИЙ Б: ЗАГОЛОВОК БЕЗ СТРАНИЦЫ ---
-            if self.structure_start.match(line_raw):
-                if pending_title:
-                    prev = self._add_node(root, current_chapter, pending_title, pending_level, None)
-                    if pending_level == 1: current_chapter = prev
-                    seen_titles.add(self._normalize(pending_title))
-
-                # Разделение слипшихся 3.1Пакет
-                parts = re.split(r'(?<=[а-яА-Яa-zA-Z])\s+(?=\d+\.\d+)', line_raw)
-                if len(parts) > 1:
-                    for p in parts[:-1]:
-                        node = self._add_node(root, current_chapter, p, self._guess_level(p), None)
-                        if self._guess_level(p) == 1: current_chapter = node
-                        seen_titles.add(self._normalize(p))
-                    pending_title = parts[-1]
-                else:
-                    pending_title = line_raw
-
-                pending_level = self._guess_level(pending_title)
-                misses = 0
-                continue
-
-            # --- СЦЕНАРИЙ В: ТЕКСТ (ХВОСТ) ---
-            if pending_title:
-                if re.match(r'^\d+$', line_raw):
-                    self._add_node(root, current_chapter, pending_title, pending_level, line_raw)
-                    if pending_level == 1 and root.children: current_chapter = root.children[-1]
-                    seen_titles.add(self._normalize(pending_title))
-                    pending_title = ""
-                elif len(pending_title + line_raw) < 300:
-                    pending_title += " " + line_raw
-                else:
-                    pending_title = ""
-                misses = 0
-            else:
-                misses += 1
-                if misses > MAX_MISSES: break
-
-        if pending_title:
-            self._add_node(root, current_chapter, pending_title, pending_level, None)
-            seen_titles.add(self._normalize(pending_title))
-
-        return root
+        scanner = self.scanner()
+        scanner.feed(text)
+        return scanner.finish()
+
+    def scanner(self):
+        """Пошаговый разбор: текст подаётся частями (например, по страницам) через feed()."""
+        return TocScanner(self)
+
+    def classify(self, line):
+        """Вид строки ('strict', 'start', 'loose', 'structure' или None) и совпадение - одним проходом."""
+        m = LINE.match(line)
+        if m is None: return None, None
+        for kind in ('strict', 'start', 'loose', 'structure'):
+            if m.group(kind) is not None: return kind, m
+        return None, None
 
     def _add_node(self, root, current_chapter, title, level, page):
-        title = re.sub(r'^(\d+\.)([А-ЯA-Z])', r'\1 \2', title)
-        title = re.sub(r'([._\s\t\…]*){2,}$', '', title).strip()
+        title = _GLUED_NUMBER.sub(r'\1 \2', title)
+        title = _strip_leader(title).strip()
         title = title.strip('\t')
         node = TocNode(title, level, page)
         if level == 2 and current_chapter:
@@ -186,7 +117,7 @@ class HeuristicParser:
                ['глава', 'chapter', 'часть', 'раздел', 'введение', 'заключение', 'об авторе', 'предисловие',
                 'благодарности']):
             return 1
-        if re.match(r'^\s*\d+\.\s+[А-ЯA-Z]', text):
+        if _NUMBERED_CHAPTER.match(text):
             return 1
         return 2
 
@@ -195,31 +126,188 @@ class HeuristicParser:
         for line in lines:
             line = line.strip()
             if not line: continue
-            line = re.sub(r'^\d+\s+(?=(Глава|Chapter|§|[0-9]+\.|[A-Za-zА-Яа-я]))', '', line)
+            line = _PAGE_NUMBER_PREFIX.sub('', line)
             cleaned.append(line)
         return cleaned
 
     def _normalize(self, text):
-        return re.sub(r'[\W_]+', '', text).lower()
+        return _NON_WORD.sub('', text).lower()
 
     def _is_content_start(self, norm_line, seen_titles):
-        if len(norm_line) < 10: return False
-        for s in seen_titles:
-            if len(s) > 10 and norm_line.startswith(s):
-                return True
-        return False
+        # Строка основного текста начинается с уже встреченного длинного заголовка
+        if len(norm_line) < CONTENT_START_MIN: return False
+        return seen_titles.has_prefix_of(norm_line)
+
+
+class TocScanner:
+    """
+    Состояние разбора оглавления между порциями текста.
+    started - оглавление найдено, ended - оглавление закончилось (дальше читать не нужно),
+    count - сколько пунктов добавлено, strict - сколько из них по строгим строкам (отточие и номер страницы).
+    """
+    MAX_MISSES = 50
+
+    def __init__(self, parser: HeuristicParser):
+        self.parser = parser
+        self.root = TocNode("Root", 0)
+        self.current_chapter = None
+        self.pending_title = ""
+        self.pending_level = 0
+        self.seen_titles = TitlePrefixes(CONTENT_START_MIN)
+        self.started = False
+        self.ended = False
+        self.misses = 0
+        self.count = 0
+        self.strict = 0
+
+    def feed(self, text: str):
+        for line in self.parser._preprocess_lines(text.split('\n')):
+            if self.ended: return
+            self._line(line)
+
+    def finish(self) -> TocNode:
+        if self.pending_title:
+            self.parser._add_node(self.root, self.current_chapter, self.pending_title, self.pending_level, None)
+            self.seen_titles.add(self.parser._normalize(self.pending_title))
+            self.pending_title = ""
+        return self.root
+
+    def _add(self, title, level, page):
+        self.count += 1
+        return self.parser._add_node(self.root, self.current_chapter, title, level, page)
+
+    def _line(self, line):
+        p = self.parser
+        root = self.root
+        seen_titles = self.seen_titles
+
+        line_raw = line.strip()
+        if not line_raw: return
+
+        norm_line = p._normalize(line_raw)
+        kind, match = p.classify(line_raw)
+
+        # --- 1. ПОИСК СТАРТА ---
+        if not self.started:
+            if 'краткое' in norm_line: return
+            if len(line_raw) < 50 and (
+                    any(m in norm_line for m in p.header_markers) or line_raw.upper() == "ВВЕДЕНИЕ"):
+                self.started = True
+                if line_raw.upper() == "ВВЕДЕНИЕ":
+                    self._add(line_raw, 1, None)
+                    seen_titles.add(p._normalize(line_raw))
+                return
+            # Слабый пункт сам по себе оглавление не начинает - только если строка ещё и начало структуры
+            if kind in ('strict', 'start', 'structure') or (kind == 'loose' and p.structure_start.match(line_raw)):
+                self.started = True
+            else:
+                return
+
+        # --- 2. ПРОВЕРКА НА ВЫХОД (Конец оглавления) ---
+        has_page = kind in PAGE_KINDS
+
+        if not has_page and p._is_content_start(norm_line, seen_titles):
+            self.ended = True
+            return
+
+        if len(line_raw) < 50 and any(m in norm_line for m in p.header_markers):
+            return
+
+        if len(line_raw) > 300:
+            self.pending_title = ""
+            self.misses += 1
+            if self.misses > self.MAX_MISSES: self.ended = True
+            return
+
+        # --- СЦЕНАРИЙ А: ЕСТЬ СТРАНИЦА ---
+        if has_page:
+            if kind == 'strict':
+                self.strict += 1
+                title_part, page_part = match.group('title').strip(), match.group('page')
+            elif kind == 'start':
+                page_part, title_part = match.group('start_page'), match.group('start_title').strip()
+            else:
+                title_part, page_part = match.group('loose_title').strip(), match.group('loose_page')
+
+            if self.pending_title:
+                if not p.structure_start.match(title_part):
+                    full_title = self.pending_title + " " + title_part
+                    self._add(full_title, self.pending_level, page_part)
+                    if self.pending_level == 1 and root.children: self.current_chapter = root.children[-1]
+                    seen_titles.add(p._normalize(full_title))
+                    self.pending_title = ""
+                    self.misses = 0
+                    return
+                else:
+                    prev = self._add(self.pending_title, self.pending_level, None)
+                    if self.pending_level == 1: self.current_chapter = prev
+                    seen_titles.add(p._normalize(self.pending_title))
+                    self.pending_title = ""
+
+            level = p._guess_level(title_part)
+            if not self.current_chapter: level = 1
+            new_node = self._add(title_part, level, page_part)
+            if level == 1: self.current_chapter = new_node
+            seen_titles.add(p._normalize(title_part))
+            self.misses = 0
+            return
+
+        # --- СЦЕНАРИЙ Б: ЗАГОЛОВОК БЕЗ СТРАНИЦЫ ---
+        if kind == 'structure':
+            if self.pending_title:
+                prev = self._add(self.pending_title, self.pending_level, None)
+                if self.pending_level == 1: self.current_chapter = prev
+                seen_titles.add(p._normalize(self.pending_title))
+
+            # Разделение слипшихся 3.1Пакет
+            parts = _GLUED_SUBSECTIONS.split(line_raw)
+            if len(parts) > 1:
+                for part in parts[:-1]:
+                    node = self._add(part, p._guess_level(part), None)
+                    if p._guess_level(part) == 1: self.current_chapter = node
+                    seen_titles.add(p._normalize(part))
+                self.pending_title = parts[-1]
+            else:
+                self.pending_title = line_raw
+
+            self.pending_level = p._guess_level(self.pending_title)
+            self.misses = 0
+            return
+
+        # --- СЦЕНАРИЙ В: ТЕКСТ (ХВОСТ) ---
+        if self.pending_title:
+            if _DIGITS.match(line_raw):
+                self._add(self.pending_title, self.pending_level, line_raw)
+                if self.pending_level == 1 and root.children: self.current_chapter = root.children[-1]
+                seen_titles.add(p._normalize(self.pending_title))
+                self.pending_title = ""
+            elif len(self.pending_title + line_raw) < 300:
+                self.pending_title += " " + line_raw
+            else:
+                self.pending_title = ""
+            self.misses = 0
+        else:
+            self.misses += 1
+            if self.misses > self.MAX_MISSES: self.ended = True
 
 
 # ЭТА ФУНКЦИЯ ДОЛЖНА БЫТЬ ЗДЕСЬ (ДЛЯ ИСПРАВЛЕНИЯ IMPORT ERROR)
 def toc_to_linear_sequence(node: TocNode) -> list:
     sequence = []
+    _linearize(node, sequence)
+    return sequence
+
+
+def _linearize(node, sequence):
+    # Пункты поддерева пишутся в общий список, а не склеиваются из списков детей на каждом уровне
+    start = len(sequence)
     if node.title != "Root":
         p = int(node.page) if str(node.page).isdigit() else None
         sequence.append({"title": node.title, "level": node.level, "page": p})
     for child in node.children:
-        sequence.extend(toc_to_linear_sequence(child))
+        _linearize(child, sequence)
 
-    for i in range(len(sequence)):
-        if sequence[i]['page'] is None and i + 1 < len(sequence):
+    # Пропущенная страница берётся у следующего пункта - в пределах поддерева, как и раньше
+    for i in range(start, len(sequence) - 1):
+        if sequence[i]['page'] is None:
             sequence[i]['page'] = sequence[i + 1]['page']
-    return sequence
\ No newline at end of file
@@ -1,36 +1,115 @@
-from .pdf_utils import find_real_indices, get_clean_title
+import codecs
+import os
+from contextlib import contextmanager
+from .pdf_utils import find_real_indices
 from .toc_parser import HeuristicParser, toc_to_linear_sequence
+from .spool import open_mapped
+from .sections import SectionTable
+from .metrics import stage
 
+FALLBACK_ENCODING = 'cp1251'
+# Кодировка угадывается по трём окнам (начало, середина, конец), а не по всему файлу
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# Оглавление ищется в начале книги
+TOC_CHARS = 50000
 
-def parse_txt(file_path) -> tuple:
-    full_text = ""
+
+@contextmanager
+def _mapped(source):
+    # source - путь к файлу или буфер (memoryview над mmap)
+    if not isinstance(source, str):
+        yield source
+    elif os.path.getsize(source) == 0:
+        # Пустой файл отобразить в память нельзя
+        yield b""
+    else:
+        with open_mapped(source) as buffer:
+            yield buffer
+
+
+def detect_encoding(buffer) -> str:
+    """UTF-8, если все окна выборки декодируются как UTF-8, иначе cp1251."""
+    size = len(buffer)
+    for offset in sorted({0, max(0, size // 2 - ENCODING_SAMPLE_BYTES // 2), max(0, size - ENCODING_SAMPLE_BYTES)}):
+        window = buffer[offset:offset + ENCODING_SAMPLE_BYTES]
+        if offset:
+            # Окно может начаться посреди многобайтного символа - хвост предыдущего пропускается
+            skip = 0
+            while skip < 3 and skip < len(window) and 0x80 <= window[skip] <= 0xBF: skip += 1
+            window = window[skip:]
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(window, offset + ENCODING_SAMPLE_BYTES >= size)
+        except UnicodeDecodeError:
+            return FALLBACK_ENCODING
+    return 'utf-8'
+
+
+def _newlines(text) -> str:
+    # Как универсальные переводы строк open(..., 'r'): \r\n и одиночный \r становятся \n
+    if '\r' in text: text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def read_head(buffer, encoding, chars) -> str:
+    """Первые chars символов текста (без \\x00); декодируется только нужное начало файла."""
+    limit = chars * 4
+    while True:
+        final = limit >= len(buffer)
+        text = _newlines(codecs.getincrementaldecoder(encoding)().decode(buffer[:limit], final)).replace('\x00', '')
+        if len(text) >= chars or final: return text[:chars]
+        limit *= 2
+
+
+def decode(buffer, encoding) -> tuple:
+    """
+    Весь текст одним декодированием с универсальными переводами строк;
+    cp1251 - только если выборка ошиблась с UTF-8.
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            full_text = f.read()
+        return _newlines(str(buffer, encoding)), encoding
     except UnicodeDecodeError:
-        with open(file_path, 'r', encoding='cp1251') as f:
-            full_text = f.read()
+        if encoding == FALLBACK_ENCODING: raise
+        return _newlines(str(buffer, FALLBACK_ENCODING)), FALLBACK_ENCODING
 
-    full_text = full_text.replace('\x00', '')
 
-    parser = HeuristicParser()
-    toc_tree = parser.parse_toc(full_text[:50000])
-    sequence = toc_to_linear_sequence(toc_tree)
+def read_text(source) -> str:
+    with _mapped(source) as buffer:
+        return decode(buffer, detect_encoding(buffer))[0]
 
-    mapped = find_real_indices(full_text, sequence)
-    final_nodes = []
 
-    for i in range(len(mapped)):
-        curr = mapped[i]
-        start = curr['end_idx']
-        end = mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text)
+def _toc_sequence(head):
+    return toc_to_linear_sequence(HeuristicParser().parse_toc(head))
+
 
-        content = full_text[start:end].strip()
-        final_nodes.append({
-            "title": curr['item']['title'],
-            "content": content,
-            "level": curr['item'].get('level', 1),
-            "page": 0
-        })
+def parse_txt(source) -> tuple:
+    with _mapped(source) as buffer:
+        with stage("txt", "toc") as s:
+            encoding = detect_encoding(buffer)
+            try:
+                head = read_head(buffer, encoding, TOC_CHARS)
+            except UnicodeDecodeError:
+                encoding = FALLBACK_ENCODING
+                head = read_head(buffer, encoding, TOC_CHARS)
+            sequence = _toc_sequence(head)
+            s.chars = len(head)
+        # Без оглавления разделов не будет - остальной текст не декодируется вовсе
+        if not sequence:
+            return SectionTable(), sequence
+
+        with stage("txt", "read") as s:
+            full_text, actual = decode(buffer, encoding)
+            full_text = full_text.replace('\x00', '')
+            s.chars = len(full_text)
+    if actual != encoding:
+        sequence = _toc_sequence(full_text[:TOC_CHARS])
+
+    with stage("txt", "find_real_indices") as s:
+        mapped = find_real_indices(full_text, sequence)
+        s.chars = len(full_text)
+    # Разделы - срезы общего текста, строки вырезаются только при записи XML
+    sections = SectionTable(full_text)
+    for i, curr in enumerate(mapped):
+        end = mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text)
+        sections.add(curr['item']['title'], curr['item'].get('level', 1), 0, curr['end_idx'], end)
 
-    return final_nodes, sequence
\ No newline at end of file
+    return sections, sequence
@@ -1,62 +1,125 @@
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import re
 
+from .normalize import XML_ILLEGAL
+from .sections import SectionTable
+
 
 def clean_xml_string(s: str) -> str:
     if not s: return ""
-    illegal_chars = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
-    return illegal_chars.sub('', s)
-
-
-def build_tree_structure(flat_nodes: list) -> dict:
-    root = {"title": "Book Root", "children": [], "level": 0, "content": "", "page": 0}
-    stack = [root]
-    for node in flat_nodes:
-        if not node.get('title'): continue
-        new_node = {
-            "title": clean_xml_string(node['title']),
-            "content": clean_xml_string(node.get('content', '')),
-            "children": [],
-            "level": node.get('level', 1),
-            "page": node.get('page', 0) if node.get('page') else 0
-        }
-        while len(stack) > 1 and stack[-1]['level'] >= new_node['level']:
-            stack.pop()
-        stack[-1]['children'].append(new_node)
-        stack.append(new_node)
-    return root
-
-
-def dict_to_xml(data: dict, toc_items: list = None) -> str:
-    def create_element(node):
-        p = str(node.get('page', ''))
-        if p == "0" or p == "None": p = ""
-        elem = ET.Element("section", title=node.get('title', ''), page=p)
-        if node.get('content') and node['content'].strip():
-            content_elem = ET.SubElement(elem, "content")
-            content_elem.text = node['content']
-        for child in node.get('children', []):
-            elem.append(create_element(child))
-        return elem
-
-    root_elem = ET.Element("Book")
-    if toc_items:
-        nav = ET.SubElement(root_elem, "NavigationTable")
-        for item in toc_items:
-            p = str(item.get('page', ''))
-            if p == "None": p = ""
-            ET.SubElement(nav, "Item",
-                          title=clean_xml_string(str(item.get('title', ''))),
-                          page=p,
-                          level=str(item.get('level', '')))
-
-    for child in data.get('children', []):
-        root_elem.append(create_element(child))
-
-    raw_str = ET.tostring(root_elem, encoding='utf-8')
-    try:
-        parsed = minidom.parseString(raw_str)
-        return parsed.toprettyxml(indent="  ")
-    except:
-        return raw_str.decode('utf-8')
\ No newline at end of file
+    return XML_ILLEGAL.sub('', s)
+
+
+# Видимый символ: не пробельный и не вырезаемый clean_xml_string
+_VISIBLE = re.compile(r'[^\s\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Необработанный срез общего текста чистится и экранируется кусками такого размера,
+# так что даже огромный раздел не копируется целиком
+PIECE = 1 << 20
+
+
+def _pieces(text, pos, end):
+    while pos < end:
+        cut = min(pos + PIECE, end)
+        # \r\n не разрывается: экранирование заменяет пару целиком
+        if cut < end and text[cut - 1] == '\r': cut += 1
+        yield text[pos:cut]
+        pos = cut
+
+
+# Экранирование повторяет цепочку ET.tostring -> minidom.toprettyxml,
+# чтобы потоковый вывод совпадал с прежним побайтно.
+def _escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _escape_text(s: str) -> str:
+    # XML-парсер нормализует переводы строк в тексте (\r\n, \r -> \n)
+    return _escape(s.replace("\r\n", "\n").replace("\r", "\n"))
+
+
+def _iter_sections(sections):
+    """
+    Разделы плоской таблицы как вложенные <section>: раздел вложен в ближайший предыдущий
+    с меньшим уровнем. Дерево не строится - открытые разделы держатся стеком уровней.
+    """
+    titles, levels, pages = sections.titles, sections.levels, sections.pages
+    kept = [i for i, title in enumerate(titles) if title]
+    open_levels = []
+    for n, i in enumerate(kept):
+        level = levels[i]
+        while open_levels and open_levels[-1] >= level:
+            open_levels.pop()
+            yield f"{'  ' * (len(open_levels) + 1)}</section>\n"
+        indent = "  " * (len(open_levels) + 1)
+        p = str(pages[i]) if pages[i] else ""
+        head = f'{indent}<section title="{_escape(clean_xml_string(titles[i]))}" page="{_escape(p)}"'
+
+        if sections.lazy:
+            text, start, end = sections.text, sections.starts[i], sections.ends[i]
+            has_content = _VISIBLE.search(text, start, end) is not None
+        else:
+            content = clean_xml_string(sections.content(i))
+            has_content = bool(content and content.strip())
+        has_children = n + 1 < len(kept) and levels[kept[n + 1]] > level
+        if not has_content and not has_children:
+            yield head + "/>\n"
+            continue
+        yield head + ">\n"
+        if has_content:
+            # Текст раздела отдаётся отдельными частями, без лишней копии в f-строке
+            yield f"{indent}  <content>"
+            if sections.lazy:
+                for piece in _pieces(text, start, end):
+                    yield _escape_text(clean_xml_string(piece))
+            else:
+                yield _escape_text(content)
+            yield "</content>\n"
+        if has_children:
+            open_levels.append(level)
+        else:
+            yield f"{indent}</section>\n"
+    while open_levels:
+        open_levels.pop()
+        yield f"{'  ' * (len(open_levels) + 1)}</section>\n"
+
+
+def iter_xml(sections: SectionTable, toc_items: list = None, chunk_size: int = 64 * 1024):
+    """
+    Потоково сериализует таблицу разделов в XML с отступами, отдавая куски ~chunk_size символов.
+    """
+    def parts():
+        yield '<?xml version="1.0" ?>\n'
+        if not toc_items and not any(sections.titles):
+            yield "<Book/>\n"
+            return
+        yield "<Book>\n"
+        if toc_items:
+            yield "  <NavigationTable>\n"
+            for item in toc_items:
+                p = str(item.get('page', ''))
+                if p == "None": p = ""
+                title = clean_xml_string(str(item.get('title', '')))
+                level = str(item.get('level', ''))
+                yield f'    <Item title="{_escape(title)}" page="{_escape(p)}" level="{_escape(level)}"/>\n'
+            yield "  </NavigationTable>\n"
+        yield from _iter_sections(sections)
+        yield "</Book>\n"
+
+    buffer, size = [], 0
+    for part in parts():
+        if len(part) >= chunk_size:
+            # Большой раздел уходит как есть - склейка в кусок только скопировала бы его
+            if buffer: yield "".join(buffer)
+            yield part
+            buffer, size = [], 0
+            continue
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def to_xml(sections: SectionTable, toc_items: list = None) -> str:
+    return "".join(iter_xml(sections, toc_items=toc_items))
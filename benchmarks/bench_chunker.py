@@ -0,0 +1,96 @@
+"""
+Нарезка большого раздела для нейро-чистки: куски по 6000 символов против split_chunks.
+
+    python -m benchmarks.bench_chunker --chars 20000 100000 --budget 3000
+
+Текст - проза из предложений и абзацев, свёрстанная строками по 72 символа с переносами слов,
+как в PDF-экстракте. Для каждого способа выводятся число запросов, средняя заполненность куска
+(оценка токенов к бюджету; у кусков по символам может быть больше 100%) и швы: по абзацу,
+по концу предложения, между словами, посреди слова или переноса.
+"""
+import argparse
+import random
+import re
+import time
+
+from app.services.chunker import estimate_tokens, split_chunks
+
+WORDS = ("анализ структура раздел книга текст система алгоритм заголовок оглавление страница "
+         "колонтитул обработка документ модель результат исследование преобразование").split()
+LINE = 72
+_PARAGRAPH_END = re.compile(r'\n[ \t]*\n\s*$')
+_SENTENCE_END = re.compile(r'[.!?…][»"”\')\]]*\s+$')
+
+
+def prose(chars, seed=7):
+    rnd = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < chars:
+        sentences = []
+        for _ in range(rnd.randint(2, 8)):
+            words = [rnd.choice(WORDS) for _ in range(rnd.randint(5, 18))]
+            sentences.append(" ".join(words).capitalize() + rnd.choice(".....!?"))
+        paragraph = wrap(" ".join(sentences), rnd)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def wrap(text, rnd):
+    """Строки по LINE символов; слово, не влезшее в строку, иногда переносится через дефис."""
+    lines, line = [], ""
+    for word in text.split():
+        if len(line) + len(word) + 1 <= LINE:
+            line = f"{line} {word}" if line else word
+            continue
+        room = LINE - len(line) - 2
+        if room > 2 and len(word) > room + 2 and rnd.random() < 0.5:
+            lines.append(f"{line} {word[:room]}-")
+            line = word[room:]
+        else:
+            lines.append(line)
+            line = word
+    return "\n".join(lines + [line])
+
+
+def by_chars(text, size=6000):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def seam(head, tail):
+    if _PARAGRAPH_END.search(head[-20:]): return "paragraph"
+    if _SENTENCE_END.search(head[-20:]): return "sentence"
+    if head[-1].isspace() and not head.rstrip().endswith("-"): return "word"
+    if tail[:1].isspace() and head[-1] != "-": return "word"
+    return "broken"
+
+
+def report(name, text, chunks, budget, elapsed):
+    assert "".join(chunks) == text
+    seams = {"paragraph": 0, "sentence": 0, "word": 0, "broken": 0}
+    pos = 0
+    for chunk in chunks[:-1]:
+        pos += len(chunk)
+        seams[seam(text[:pos], text[pos:])] += 1
+    fill = [estimate_tokens(chunk) / budget for chunk in chunks[:-1]] or [estimate_tokens(text) / budget]
+    print(f"  {name}: requests={len(chunks)} fill={sum(fill) / len(fill):.0%} max={max(fill):.0%} "
+          f"seams={seams} time={elapsed * 1000:.1f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chars", type=int, nargs="+", default=[8000, 20000, 100000])
+    ap.add_argument("--budget", type=int, default=3000, help="бюджет токенов куска")
+    args = ap.parse_args()
+
+    for chars in args.chars:
+        text = prose(chars)
+        print(f"text={len(text)} chars, ~{estimate_tokens(text)} tokens, budget={args.budget}")
+        for name, fn in (("by_chars", lambda: by_chars(text)), ("split_chunks", lambda: split_chunks(text, args.budget))):
+            t = time.perf_counter()
+            chunks = fn()
+            report(name, text, chunks, args.budget, time.perf_counter() - t)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Нейро-чистка книги с множеством коротких разделов: по запросу на раздел против пакетов.
+
+    python -m benchmarks.bench_llm_batching --sections 200 --latency 0.2 --concurrency 4
+
+Заглушка модели возвращает текст из промпта, поэтому результат обоих режимов должен совпасть.
+С --mangle заглушка теряет разделители пакета, и каждый пакет откатывается на запросы по разделам.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from openai import AsyncOpenAI
+
+from app.services.llm_engine import llm_client
+from app.services.pdf_parser_neural import clean_sections
+from app.services.sections import SectionTable
+from benchmarks.stub_llm import StubServer
+
+
+def make_sections(count, seed=5):
+    """Таблица разделов: в основном короткие подразделы (100-1500 символов), изредка длинная глава."""
+    rnd = random.Random(seed)
+    words = "альфа бета гамма дельта эпсилон книга текст раздел система анализ".split()
+    bodies = []
+    for i in range(count):
+        size = rnd.choice([15, 40, 100, 200]) if i % 25 else 1500
+        bodies.append(" ".join(rnd.choice(words) for _ in range(size)))
+    text = "\n".join(bodies)
+    sections, pos = SectionTable(text), 0
+    for i, body in enumerate(bodies):
+        sections.add(f"{i // 10 + 1}.{i % 10 + 1} Раздел", 2, i + 1, pos, pos + len(body))
+        pos += len(body) + 1
+    return sections
+
+
+async def run(sections):
+    messages = []
+
+    async def progress(pct, message):
+        messages.append(message)
+
+    result = await clean_sections(sections, progress)
+    return [result.content(i) for i in range(len(result))], messages[-1] if messages else ""
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sections", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--mangle", action="store_true", help="заглушка ломает разделители пакета")
+    args = ap.parse_args()
+
+    llm_client.cache = None
+    llm_client.concurrency = args.concurrency
+    results = {}
+    with StubServer(latency=args.latency, mangle_batches=args.mangle) as stub:
+        # BATCH_SECTIONS = 1 - каждый раздел отдельным запросом, как до пакетной чистки
+        for name, batch in (("per-section", 1), ("batched", llm_client.BATCH_SECTIONS)):
+            llm_client.client = AsyncOpenAI(base_url=stub.base_url, api_key="stub")
+            llm_client._slots = asyncio.Semaphore(args.concurrency)
+            llm_client.BATCH_SECTIONS = batch
+            before = stub.requests
+            t = time.perf_counter()
+            results[name], last = asyncio.run(run(make_sections(args.sections)))
+            print(f"{name}: sections={args.sections} requests={stub.requests - before} "
+                  f"time={time.perf_counter() - t:.2f}s progress=\"{last}\"")
+    print(f"identical={results['per-section'] == results['batched']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Пропускная способность нейро-чистки при разных лимитах одновременных запросов.
+
+    python -m benchmarks.bench_llm_concurrency --sections 40 --latency 0.2 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.services.llm_engine import LLMEngine
+from benchmarks.stub_llm import StubServer
+
+
+def make_sections(count, seed=3):
+    rnd = random.Random(seed)
+    words = "альфа бета гамма дельта эпсилон книга текст раздел система анализ".split()
+    # Часть разделов длиннее одного куска (бюджета токенов модели)
+    return [" ".join(rnd.choice(words) for _ in range(rnd.choice([200, 400, 1500]))) for _ in range(count)]
+
+
+async def run(engine, sections):
+    try:
+        return await asyncio.gather(*[engine.process_large_text(s, is_start=False) for s in sections])
+    finally:
+        await engine.client.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sections", type=int, default=40)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = ap.parse_args()
+
+    sections = make_sections(args.sections)
+    with StubServer(latency=args.latency) as stub:
+        for limit in args.concurrency:
+            # Без кэша ответов: иначе со второго лимита все запросы - попадания в кэш, и мерить нечего
+            engine = LLMEngine(base_url=stub.base_url, model="stub", concurrency=limit, cache_dir=None)
+            before = stub.requests
+            t = time.perf_counter()
+            results = asyncio.run(run(engine, sections))
+            elapsed = time.perf_counter() - t
+            requests = stub.requests - before
+            print(f"concurrency={limit} sections={len(results)} requests={requests} "
+                  f"time={elapsed:.2f}s throughput={requests / elapsed:.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Разбор формул OMML: прежний рекурсивный разбор с поиском по потомкам против omml_to_text.
+
+    python -m benchmarks.bench_omml --depth 50 150 300 1000 --repeat 3
+
+Формулы вложены на заданную глубину: дроби в знаменателе (прежний разбор здесь ещё верен),
+степени в основании и корни в подкоренном выражении (прежний разбор берёт не тот m:sup/m:e).
+На большой глубине прежний рекурсивный разбор упирается в предел рекурсии Python.
+"""
+import argparse
+import time
+
+from lxml import etree
+
+from app.services.omml import omml_to_text
+
+M = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+NAMESPACES = {'m': M}
+
+
+def _el(parent, name):
+    return etree.SubElement(parent, f"{{{M}}}{name}")
+
+
+def _run(parent, text):
+    _el(_el(parent, "r"), "t").text = text
+
+
+def make_formula(kind, depth):
+    """m:oMath глубины depth; в каждом уровне - несколько слагаемых, чтобы формула была и широкой."""
+    root = etree.Element(f"{{{M}}}oMath", nsmap={'m': M})
+    node = root
+    for i in range(depth):
+        _run(node, f"a{i}+")
+        if kind == "frac":
+            f = _el(node, "f")
+            _el(f, "fPr")
+            _run(_el(f, "num"), f"x{i}")
+            node = _el(f, "den")
+        elif kind == "sup":
+            s = _el(node, "sSup")
+            base = _el(s, "e")
+            _run(_el(s, "sup"), str(i))
+            node = base
+        else:
+            r = _el(node, "rad")
+            _run(_el(r, "deg"), "3" if i % 2 else "")
+            node = _el(r, "e")
+    _run(node, "z")
+    return root
+
+
+def recurse_omml(element):
+    """Прежняя реализация: части конструкций ищутся по всем потомкам (.//m:e), строки склеиваются +=."""
+    tag = element.tag
+    local_tag = tag.split('}')[-1] if '}' in tag else tag
+    if local_tag == 't':
+        return element.text if element.text else ""
+    if local_tag == 'f':
+        num_node = element.find('.//m:num', NAMESPACES)
+        den_node = element.find('.//m:den', NAMESPACES)
+        num_text = recurse_omml(num_node) if num_node is not None else ""
+        den_text = recurse_omml(den_node) if den_node is not None else ""
+        return f"({num_text}/{den_text})"
+    if local_tag == 'rad':
+        deg_node = element.find('.//m:deg', NAMESPACES)
+        base_node = element.find('.//m:e', NAMESPACES)
+        base_text = recurse_omml(base_node) if base_node is not None else ""
+        deg_text = ""
+        if deg_node is not None:
+            raw_deg = "".join([recurse_omml(c) for c in deg_node])
+            if raw_deg:
+                deg_text = f"^{raw_deg}"
+        return f"√{deg_text}({base_text})"
+    if local_tag == 'sSup':
+        base_node = element.find('.//m:e', NAMESPACES)
+        sup_node = element.find('.//m:sup', NAMESPACES)
+        base_text = recurse_omml(base_node) if base_node is not None else ""
+        sup_text = recurse_omml(sup_node) if sup_node is not None else ""
+        return f"{base_text}^({sup_text})"
+    result = ""
+    for child in element:
+        result += recurse_omml(child)
+    return result
+
+
+def timed(fn, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--depth", type=int, nargs="+", default=[50, 150, 300, 1000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    for kind in ("frac", "sup", "rad"):
+        for depth in args.depth:
+            formula = make_formula(kind, depth)
+            t_new, new = timed(omml_to_text, formula, repeat=args.repeat)
+            t_latex, _ = timed(omml_to_text, formula, "latex", repeat=args.repeat)
+            try:
+                t_old, old = timed(recurse_omml, formula, repeat=args.repeat)
+                versus = f"old={t_old * 1000:.2f}ms speedup={t_old / t_new:.1f}x identical={old == new}"
+            except RecursionError:
+                versus = "old=RecursionError"
+            print(f"{kind:<4} depth={depth:<4} nodes={sum(1 for _ in formula.iter())} "
+                  f"new={t_new * 1000:.2f}ms latex={t_latex * 1000:.2f}ms {versus}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Сравнение поиска заголовков: прежний поиск регулярными выражениями против find_real_indices
+(выражение на заголовок, автомат TitleMatcher - после первого промаха).
+
+    python -m benchmarks.bench_title_matcher --sections 400 --chars 3000000 --miss 0.1
+"""
+import argparse
+import random
+import re
+import time
+
+from app.services.pdf_utils import find_real_indices, find_toc_boundary, get_clean_title
+
+WORDS = ("альфа бета гамма дельта эпсилон книга текст раздел система анализ структура данные "
+         "модель метод процесс функция значение результат пример задача").split()
+
+
+SYLLABLES = "ка ро ми на те ло ва ду ст пр ен ол ит ер ан ов".split()
+
+
+def make_book(sections, chars, miss, seed=7):
+    """Синтетическая книга: оглавление и разделы, часть заголовков в тексте отсутствует."""
+    rnd = random.Random(seed)
+    # Словарь основного текста шире словаря заголовков, как в настоящих книгах
+    vocabulary = WORDS + ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(5000)]
+    sequence, toc, body = [], ["Оглавление"], []
+    body_len = chars // sections
+    for i in range(sections):
+        chapter = i // 10 + 1
+        words = " ".join(rnd.choice(WORDS) for _ in range(3)).capitalize()
+        title = f"Глава {chapter}. {words}" if i % 10 == 0 else f"{chapter}.{i % 10} {words}"
+        sequence.append({"title": title, "level": 1 if i % 10 == 0 else 2, "page": i * 3 + 5})
+        toc.append(f"{title} ..... {i * 3 + 5}")
+        if rnd.random() >= miss: body.append(title)
+        text, size = [], 0
+        while size < body_len:
+            w = rnd.choice(vocabulary)
+            text.append(w)
+            size += len(w) + 1
+        body.append(" ".join(text))
+    return "\n".join(toc + body) + "\n", sequence
+
+
+def find_real_indices_regex(full_text, sequence):
+    """Прежняя реализация: отдельное регулярное выражение на каждый вариант заголовка."""
+    start_pos = find_toc_boundary(full_text, sequence)
+    indices_map = []
+    current_pos = start_pos
+    for item in sequence:
+        full_title = item['title'].strip()
+        if not full_title: continue
+        found_match = None
+        for title_to_search in [full_title, get_clean_title(full_title)]:
+            tokens = re.findall(r'[a-zA-Zа-яА-Я0-9§]+', title_to_search)
+            if not tokens: continue
+            pattern = re.compile(r"[\s\W]*?".join([re.escape(t) for t in tokens]), re.IGNORECASE | re.DOTALL)
+            match = pattern.search(full_text, current_pos)
+            if not match: match = pattern.search(full_text, start_pos)
+            if match:
+                found_match = match
+                break
+        if found_match:
+            indices_map.append({"item": item, "start_idx": found_match.start(), "end_idx": found_match.end()})
+            current_pos = found_match.end()
+    indices_map.sort(key=lambda x: x['start_idx'])
+    return indices_map
+
+
+def timed(fn, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sections", type=int, default=400)
+    ap.add_argument("--chars", type=int, default=3_000_000)
+    ap.add_argument("--miss", type=float, nargs="+", default=[0.0, 0.1, 0.3])
+    args = ap.parse_args()
+
+    for miss in args.miss:
+        text, sequence = make_book(args.sections, args.chars, miss)
+        t_regex, old = timed(find_real_indices_regex, text, sequence)
+        t_matcher, new = timed(find_real_indices, text, sequence)
+        same = [(m['start_idx'], m['end_idx']) for m in old] == [(m['start_idx'], m['end_idx']) for m in new]
+        print(f"miss={miss:.2f} chars={len(text)} sections={len(sequence)} "
+              f"regex={t_regex:.3f}s matcher={t_matcher:.3f}s "
+              f"speedup={t_regex / t_matcher:.1f}x found={len(old)}/{len(new)} identical={same}")
+
+
+if __name__ == "__main__":
+    main()
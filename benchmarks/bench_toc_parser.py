@@ -0,0 +1,105 @@
+"""
+Разбор оглавления: прежняя классификация строк против HeuristicParser.
+
+    python -m benchmarks.bench_toc_parser --sizes 1000 5000 --files book.pdf book.txt
+
+Прежний разбор сопоставлял строку с каждым выражением отдельно, искал начало основного текста
+перебором всех встреченных заголовков (на оглавлении без номеров страниц - квадратично) и срезал
+отточие выражением с вложенным повтором. Деревья оглавления обоих разборов должны совпадать.
+Кроме синтетических оглавлений можно передать настоящие книги (--files): у PDF берутся первые
+страницы, у TXT - начало текста.
+"""
+import argparse
+import re
+import time
+
+import fitz
+
+from app.services.toc_parser import CONTENT_START_MIN, HeuristicParser, TocNode, TocScanner
+from app.services.txt_parser import TOC_CHARS, read_text
+from benchmarks.corpus import Book
+
+TOC_PAGES = 30
+
+
+class LegacyParser(HeuristicParser):
+    """Прежние классификация строки, проверка начала текста и срез отточия."""
+
+    def scanner(self):
+        scanner = TocScanner(self)
+        scanner.seen_titles = set()
+        return scanner
+
+    def classify(self, line):
+        for kind, pattern in (('strict', self.item_pattern), ('start', self.item_pattern_start),
+                              ('loose', self.loose_item_pattern), ('structure', self.structure_start)):
+            m = pattern.match(line)
+            if m: return kind, m
+        return None, None
+
+    def _add_node(self, root, current_chapter, title, level, page):
+        title = re.sub(r'^(\d+\.)([А-ЯA-Z])', r'\1 \2', title)
+        title = re.sub(r'([._\s\t\…]*){2,}$', '', title).strip()
+        title = title.strip('\t')
+        node = TocNode(title, level, page)
+        if level == 2 and current_chapter:
+            current_chapter.add_child(node)
+        else:
+            root.add_child(node)
+        return node
+
+    def _is_content_start(self, norm_line, seen_titles):
+        if len(norm_line) < CONTENT_START_MIN: return False
+        for s in seen_titles:
+            if len(s) > CONTENT_START_MIN and norm_line.startswith(s):
+                return True
+        return False
+
+
+def dump(node):
+    return node.title, node.level, node.page, [dump(c) for c in node.children]
+
+
+def synthetic(pages):
+    """Оглавление синтетической книги: с номерами страниц и без них (только заголовки)."""
+    book = Book(pages)
+    lines = book.toc_lines()
+    yield f"book-{pages}", "\n".join(["Оглавление"] + lines)
+    yield f"book-{pages}-no-pages", "\n".join(["Оглавление"] + [s["title"] for s in book.sections])
+
+
+def from_file(path):
+    if path.lower().endswith(".pdf"):
+        with fitz.open(path) as doc:
+            return "\n".join(doc[i].get_text() for i in range(min(TOC_PAGES, len(doc))))
+    return read_text(path)[:TOC_CHARS]
+
+
+def timed(fn, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    ap.add_argument("--files", nargs="*", default=[])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    cases = [case for pages in args.sizes for case in synthetic(pages)]
+    cases += [(path, from_file(path)) for path in args.files]
+    for name, text in cases:
+        t_old, old = timed(lambda: dump(LegacyParser().parse_toc(text)), repeat=args.repeat)
+        t_new, new = timed(lambda: dump(HeuristicParser().parse_toc(text)), repeat=args.repeat)
+        print(f"{name}: lines={text.count(chr(10)) + 1} chapters={len(new[3])} old={t_old * 1000:.1f}ms "
+              f"new={t_new * 1000:.1f}ms speedup={t_old / t_new:.1f}x identical={old == new}")
+
+
+if __name__ == "__main__":
+    main()
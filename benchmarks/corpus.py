@@ -0,0 +1,209 @@
+"""
+Детерминированный генератор синтетических книг для замеров.
+
+Одна и та же «книга» (seed, число страниц) выпускается в PDF (страница оглавления,
+колонтитулы, номера страниц, переносы; вариант pdf-outline - ещё и с закладками), DOCX (стили заголовков, формулы OMML, таблицы)
+и TXT (UTF-8 и cp1251).
+
+    python -m benchmarks.corpus --sizes 10 100 1000 --dir .cache/bench-corpus
+"""
+import argparse
+import os
+import random
+
+import docx
+import fitz
+from docx.oxml import parse_xml
+
+SYLLABLES = "ка ро ми на те ло ва ду ст пр ен ол ит ер ан ов ре ко по ни".split()
+COMMON = ("и в не на что с как это по но из у за от так же для при его все она они мы "
+          "система анализ структура данные модель метод процесс функция значение результат").split()
+
+LINES_PER_PAGE = 36
+LINE_WIDTH = 72
+FRONT_PAGES = 2  # титульный лист и страница оглавления (без номера)
+TOC_LINES_PER_PAGE = 45
+
+OMML_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/math'
+
+_FONT = None
+
+
+def _font_buffer():
+    # Встроенный в PyMuPDF шрифт с кириллицей - не зависит от шрифтов системы
+    global _FONT
+    if _FONT is None: _FONT = fitz.Font("cjk").buffer
+    return _FONT
+
+
+class Book:
+    """План книги: разделы и текст страниц, одинаковые для всех форматов."""
+
+    def __init__(self, pages, seed=0):
+        self.pages = pages
+        self.seed = seed
+        rnd = random.Random(seed)
+        self.vocabulary = COMMON + ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 5)))
+                                    for _ in range(3000)]
+        self.title = "Синтетическая книга " + str(seed)
+
+        # Глава - каждые ~12 страниц, подраздел - каждые ~3 страницы
+        toc_pages = max(1, (pages // 3 + pages // 12) // TOC_LINES_PER_PAGE + 1)
+        self.front_pages = FRONT_PAGES + toc_pages - 1
+        body_pages = max(1, pages - self.front_pages)
+        self.sections = []
+        chapter = 0
+        sub = 0
+        for page in range(0, body_pages, 3):
+            if page % 12 == 0:
+                chapter += 1
+                sub = 0
+                title = f"Глава {chapter}. {self._words(rnd, 2, 4).capitalize()}"
+                self.sections.append({"title": title, "level": 1, "page": page + 1})
+            else:
+                sub += 1
+                title = f"{chapter}.{sub} {self._words(rnd, 2, 5).capitalize()}"
+                self.sections.append({"title": title, "level": 2, "page": page + 1})
+        self.body_pages = body_pages
+
+    def _words(self, rnd, lo, hi):
+        return " ".join(rnd.choice(self.vocabulary) for _ in range(rnd.randint(lo, hi)))
+
+    def toc_lines(self):
+        lines = []
+        for s in self.sections:
+            indent = "" if s["level"] == 1 else "    "
+            lines.append(f"{indent}{s['title']} {'.' * 8} {s['page']}")
+        return lines
+
+    def body(self):
+        """Страницы основного текста: (номер страницы, заголовок раздела или None, строки)."""
+        starts = {s["page"]: s for s in self.sections}
+        rnd = random.Random(self.seed + 1)
+        for page in range(1, self.body_pages + 1):
+            lines = []
+            while len(lines) < LINES_PER_PAGE:
+                line = self._words(rnd, 8, 12)[:LINE_WIDTH]
+                # Перенос слова на следующую строку
+                if rnd.random() < 0.15:
+                    word = rnd.choice(self.vocabulary)
+                    cut = max(1, len(word) // 2)
+                    lines.append(line + " " + word[:cut] + "-")
+                    line = word[cut:] + " " + self._words(rnd, 4, 8)
+                lines.append(line)
+            yield page, starts.get(page), lines[:LINES_PER_PAGE]
+
+
+def make_pdf(book, path, outline=False):
+    doc = fitz.open()
+    font = _font_buffer()
+
+    def new_page(lines, y=50):
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=font)
+        page.insert_text((50, y), lines, fontname="F0", fontsize=9)
+        return page
+
+    new_page([book.title, "", "Автор Авторов"], y=300)
+    toc = book.toc_lines()
+    for i in range(0, len(toc), TOC_LINES_PER_PAGE):
+        new_page((["Оглавление", ""] if i == 0 else []) + toc[i:i + TOC_LINES_PER_PAGE])
+
+    body_start = len(doc)
+    chapter_title = ""
+    for number, section, lines in book.body():
+        if section and section["level"] == 1: chapter_title = section["title"]
+        header = book.title if number % 2 else chapter_title
+        text = [header, ""] + ([section["title"], ""] if section else []) + lines
+        page = new_page(text, y=40)
+        page.insert_text((290, 810), str(number), fontname="F0", fontsize=9)
+
+    if outline:
+        doc.set_toc([[s["level"], s["title"], body_start + s["page"]] for s in book.sections])
+    doc.subset_fonts()
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def _formula(rnd):
+    a, b, c = rnd.randint(1, 9), rnd.randint(2, 9), rnd.choice("xyz")
+    return parse_xml(
+        f'<m:oMath xmlns:m="{OMML_NS}">'
+        f'<m:f><m:num><m:r><m:t>{a}</m:t></m:r></m:num><m:den><m:r><m:t>{b}</m:t></m:r></m:den></m:f>'
+        f'<m:r><m:t>+</m:t></m:r>'
+        f'<m:sSup><m:e><m:r><m:t>{c}</m:t></m:r></m:e><m:sup><m:r><m:t>2</m:t></m:r></m:sup></m:sSup>'
+        f'<m:r><m:t>=</m:t></m:r>'
+        f'<m:rad><m:deg/><m:e><m:r><m:t>{a * b}</m:t></m:r></m:e></m:rad>'
+        f'</m:oMath>'
+    )
+
+
+def make_docx(book, path):
+    d = docx.Document()
+    rnd = random.Random(book.seed + 2)
+    for number, section, lines in book.body():
+        if section:
+            d.add_heading(section["title"], section["level"])
+        # Абзац - несколько строк страницы
+        for i in range(0, len(lines), 6):
+            p = d.add_paragraph(" ".join(lines[i:i + 6]))
+            if rnd.random() < 0.1:
+                p._p.append(_formula(rnd))
+        if number % 25 == 0:
+            table = d.add_table(rows=2, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rnd.choice(book.vocabulary)
+        d.add_page_break()
+    d.save(path)
+
+
+def make_txt(book, path, encoding="utf-8"):
+    with open(path, "w", encoding=encoding) as f:
+        f.write(book.title + "\n\nОглавление\n\n")
+        f.write("\n".join(book.toc_lines()) + "\n\n")
+        for number, section, lines in book.body():
+            if section: f.write("\n" + section["title"] + "\n\n")
+            f.write("\n".join(lines) + "\n")
+
+
+FORMATS = {
+    "pdf": ("pdf", make_pdf),
+    "pdf-outline": ("pdf", lambda book, path: make_pdf(book, path, outline=True)),
+    "docx": ("docx", make_docx),
+    "txt": ("txt", make_txt),
+    "txt-cp1251": ("txt", lambda book, path: make_txt(book, path, encoding="cp1251")),
+}
+
+
+def ensure_corpus(directory, sizes, formats=tuple(FORMATS), seed=0) -> list:
+    """Создаёт недостающие файлы корпуса; возвращает [(имя, путь, формат, страниц)]."""
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for pages in sizes:
+        book = None
+        for name in formats:
+            ext, make = FORMATS[name]
+            doc_name = f"{name}-{pages}"
+            path = os.path.join(directory, f"book-{seed}-{pages}-{name}.{ext}")
+            if not os.path.exists(path):
+                book = book or Book(pages, seed)
+                make(book, path + ".part")
+                os.replace(path + ".part", path)
+            corpus.append((doc_name, path, ext, pages))
+    return corpus
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    ap.add_argument("--dir", default=".cache/bench-corpus")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    for name, path, _, _ in ensure_corpus(args.dir, args.sizes, args.formats, args.seed):
+        print(f"{name}: {path} ({os.path.getsize(path)} байт)")
+
+
+if __name__ == "__main__":
+    main()
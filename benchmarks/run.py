@@ -0,0 +1,196 @@
+"""
+Замер этапов быстрого разбора на синтетическом корпусе (benchmarks.corpus).
+
+    python -m benchmarks.run --sizes 10 100 1000 --repeat 3 --output bench.json
+    python -m benchmarks.run --sizes 10 100 1000 --baseline bench.json --threshold 0.25
+
+Каждый этап конвейера замеряется отдельно (лучшее из --repeat), результаты пишутся в JSON.
+С --baseline этапы сравниваются с прежним прогоном; замедление больше --threshold
+считается регрессией (код возврата 1).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import fitz
+
+from app.services.docx_parser import parse_docx
+from app.services.normalize import SECTION_PIPELINE
+from app.services.pdf_parser_fast import parse_pdf_fast
+from app.services.pdf_utils import (HeaderFooter, PageTexts, find_outline_indices, find_real_indices,
+                                    get_outline_sequence, get_page_offsets, open_pdf, read_toc_sequence)
+from app.services.toc_parser import HeuristicParser, toc_to_linear_sequence
+from app.services.txt_parser import parse_txt, read_text
+from app.services.sections import SectionTable
+from app.services.xml_builder import to_xml
+
+from .corpus import FORMATS, ensure_corpus
+
+# Этапы короче этого порога не сравниваются - там шум таймера больше самого замера
+MIN_COMPARABLE_S = 0.01
+
+
+class Stages:
+    """Секундомер этапов: with stages("имя"): ..."""
+
+    def __init__(self):
+        self.times = {}
+        self._name = None
+
+    def __call__(self, name):
+        self._name = name
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self._name] = self.times.get(self._name, 0.0) + time.perf_counter() - self._start
+
+
+def _sections(full_text, mapped, page=True):
+    # Как в парсерах: разделы - срезы текста, нормализация PDF применяется при записи XML
+    sections = SectionTable(full_text, clean=SECTION_PIPELINE.one if page else None)
+    for i, curr in enumerate(mapped):
+        end = mapped[i + 1]['start_idx'] if i + 1 < len(mapped) else len(full_text)
+        sections.add(curr['item']['title'], curr['item'].get('level', 1),
+                     curr['item'].get('page', 0) if page else 0, curr['end_idx'], end)
+    return sections
+
+
+def bench_pdf(path, workers):
+    """Те же шаги, что в parse_pdf_fast, по отдельности."""
+    t = Stages()
+    with t("open"):
+        doc = open_pdf(path)
+    with t("outline"):
+        sequence = get_outline_sequence(doc)
+    from_outline = bool(sequence)
+    with t("headers"):
+        headers = HeaderFooter.learn(doc)
+    store = PageTexts(doc, headers)
+    if not from_outline:
+        with t("toc"):
+            sequence, _, _ = read_toc_sequence(store)
+    headers.keep_titles(sequence)
+    with t("extract"):
+        pages = store.all(workers=workers)
+    full_text = "".join(pages)
+    if from_outline:
+        with t("find_outline_indices"):
+            mapped = find_outline_indices(full_text, sequence, get_page_offsets(pages))
+    else:
+        with t("find_real_indices"):
+            mapped = find_real_indices(full_text, sequence, get_page_offsets(pages))
+    with t("sections"):
+        sections = _sections(full_text, mapped)
+    doc.close()
+    with t("xml"):
+        xml = to_xml(sections, toc_items=sequence)
+    with t("total"):
+        parse_pdf_fast(path, workers=workers)
+    return t.times, {"sections": len(sections), "toc_items": len(sequence), "xml_bytes": len(xml)}
+
+
+def bench_txt(path, workers):
+    t = Stages()
+    with t("read"):
+        full_text = read_text(path).replace('\x00', '')
+    with t("parse_toc"):
+        sequence = toc_to_linear_sequence(HeuristicParser().parse_toc(full_text[:50000]))
+    with t("find_real_indices"):
+        mapped = find_real_indices(full_text, sequence)
+    with t("sections"):
+        sections = _sections(full_text, mapped, page=False)
+    with t("xml"):
+        xml = to_xml(sections, toc_items=sequence)
+    with t("total"):
+        parse_txt(path)
+    return t.times, {"sections": len(sections), "toc_items": len(sequence), "xml_bytes": len(xml)}
+
+
+def bench_docx(path, workers):
+    t = Stages()
+    with t("parse_docx"):
+        sections = parse_docx(path)
+    with t("xml"):
+        xml = to_xml(sections)
+    return t.times, {"sections": len(sections) - 1, "toc_items": 0, "xml_bytes": len(xml)}
+
+
+BENCHES = {"pdf": bench_pdf, "txt": bench_txt, "docx": bench_docx}
+
+
+def run(corpus, repeat=3, workers=1, log=sys.stderr) -> dict:
+    results = {}
+    for name, path, fmt, pages in corpus:
+        best, info = {}, {}
+        for _ in range(repeat):
+            times, info = BENCHES[fmt](path, workers)
+            for stage, seconds in times.items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+        results[name] = {"format": fmt, "pages": pages, "bytes": os.path.getsize(path), **info,
+                         "stages": {k: round(v, 6) for k, v in best.items()}}
+        print(f"{name:>18}: " + "  ".join(f"{k}={v:.4f}" for k, v in best.items()), file=log)
+    return results
+
+
+def compare(baseline, current, threshold) -> list:
+    """Регрессии: [(документ, этап, было, стало)] для этапов, замедлившихся больше threshold."""
+    regressions = []
+    for name, result in current.items():
+        old = baseline.get(name)
+        if old is None: continue
+        for stage, seconds in result["stages"].items():
+            before = old["stages"].get(stage)
+            if before is None or max(before, seconds) < MIN_COMPARABLE_S: continue
+            if seconds > before * (1 + threshold):
+                regressions.append((name, stage, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="размеры книг в страницах (до 5000)")
+    ap.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    ap.add_argument("--corpus-dir", default=".cache/bench-corpus")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=1, help="процессов на извлечение текста PDF")
+    ap.add_argument("--output", help="куда записать результаты JSON")
+    ap.add_argument("--baseline", help="JSON прежнего прогона для сравнения")
+    ap.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление этапа (доля)")
+    args = ap.parse_args(argv)
+
+    print("Подготовка корпуса...", file=sys.stderr)
+    corpus = ensure_corpus(args.corpus_dir, args.sizes, args.formats, args.seed)
+    results = run(corpus, args.repeat, args.workers)
+
+    report = {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "pymupdf": fitz.VersionBind, "machine": platform.machine(), "cpus": os.cpu_count(),
+                 "seed": args.seed, "repeat": args.repeat, "workers": args.workers},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(baseline, results, args.threshold)
+    for name, stage, before, after in regressions:
+        print(f"РЕГРЕССИЯ {name} {stage}: {before:.4f}s -> {after:.4f}s (+{(after / before - 1) * 100:.0f}%)")
+    if not regressions:
+        print(f"Регрессий нет (порог {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Заглушка OpenAI-совместимого сервера для замеров без настоящей модели.
+Отвечает на /v1/chat/completions с фиксированной задержкой, возвращая текст из промпта.
+С mangle_batches=True разделители пакетного запроса в ответе теряются (проверка отката по разделам).
+"""
+import asyncio
+import re
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def create_app(latency=0.2, mangle_batches=False):
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(latency)
+        prompt = body["messages"][-1]["content"]
+        # Эхо: всё после последнего маркера текста
+        content = prompt.rsplit("ТЕКСТ:", 1)[-1].rsplit("Текст:", 1)[-1].strip().strip("-").strip()
+        if mangle_batches: content = re.sub(r'<<<ФРАГМЕНТ \d+>>>\n?', '', content)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+        }
+
+    return app
+
+
+class StubServer:
+    """Запускает заглушку в фоновом потоке: with StubServer(latency=0.2) as stub: stub.base_url"""
+
+    def __init__(self, latency=0.2, mangle_batches=False):
+        self.app = create_app(latency, mangle_batches)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def requests(self):
+        return self.app.state.requests
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
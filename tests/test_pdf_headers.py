@@ -0,0 +1,56 @@
+import random
+
+import fitz
+
+from app.services.pdf_parser_fast import parse_pdf_fast
+from app.services.pdf_utils import HeaderFooter, PageTexts
+
+WORDS = "альфа бета гамма дельта система анализ данные модель метод процесс".split()
+
+
+def make_chapters(path, title):
+    """20 глав; каждая открывает страницу заголовком в одну строку с отступом до текста, как колонтитул."""
+    rnd = random.Random(5)
+    titles = [title(i, " ".join(rnd.choice(WORDS) for _ in range(2)).capitalize()) for i in range(20)]
+    doc = fitz.open()
+    font = fitz.Font("cjk").buffer
+
+    def new_page():
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=font)
+        return page
+
+    new_page().insert_text((50, 50), ["Оглавление", ""] + [f"{t} ........ {3 + 2 * i}" for i, t in enumerate(titles)],
+                           fontname="F0", fontsize=11)
+    for t in titles:
+        for k in range(2):
+            page = new_page()
+            if k == 0: page.insert_text((50, 60), t, fontname="F0", fontsize=14)
+            body = [" ".join(rnd.choice(WORDS) for _ in range(9)) for _ in range(30)]
+            page.insert_text((50, 100), body, fontname="F0", fontsize=11)
+    doc.save(path)
+    return titles
+
+
+def test_chapter_headings_at_page_top_are_not_headers(tmp_path):
+    path = str(tmp_path / "chapters.pdf")
+    titles = make_chapters(path, lambda i, name: f"{name} {i + 1}")
+    with fitz.open(path) as doc:
+        assert not HeaderFooter.learn(doc).top_bands
+
+    sections, sequence = parse_pdf_fast(path)
+    assert len(sequence) == 20
+    assert [sections.titles[i] for i in range(len(sections))] == titles
+
+
+def test_repeating_heading_lines_matching_toc_are_kept(tmp_path):
+    # "Глава 1", "Глава 2"... с точностью до цифр повторяются - полоса принимается, но заголовки остаются
+    path = str(tmp_path / "numbered.pdf")
+    titles = make_chapters(path, lambda i, name: f"Глава {i + 1}")
+    with fitz.open(path) as doc:
+        headers = HeaderFooter.learn(doc)
+        assert headers.top_bands
+        headers.keep_titles([{"title": t} for t in titles])
+        text = "".join(PageTexts(doc, headers).all())
+    lines = set(text.split("\n"))
+    assert all(t in lines for t in titles)